@@ -0,0 +1,231 @@
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+
+from observation import ObservationSeries, from_columns
+import metrics
+
+#アメダス観測の地点ごとの追記専用アーカイブ(.envのAMEDAS_ARCHIVE=1で有効)
+#1地点1ファイル({地点番号}.bin)に、観測を時刻の昇順に固定長12バイトで追記する
+#10分ごとの観測は1年で約52,560件、1地点1年で約630KB
+#読み出しはファイルをメモリマップし、時刻で二分探索した範囲だけを変換する
+#(24時間・7日などの長い期間も、通信やJSONの解析なしで切り出せる)
+#
+#ファイル形式(リトルエンディアン):
+#    ヘッダ   : マジック"KSAM", 版(u16), レコード長(u16), 地点番号(ASCII 8バイト) 計16バイト
+#    レコード : 時刻(UNIX秒, u32), 気温(0.1℃, i16), 湿度(%, u8), 風向(16方位, u8),
+#               風速(0.1m/s, u16), 1時間降水量(0.1mm, u16)
+#    欠測は気温がi16の最小値、それ以外は各型の最大値
+DEFAULT_ARCHIVE_DIR = "data/amedas_archive"
+
+MAGIC = b"KSAM"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8s")
+RECORD = np.dtype([
+    ("time", "<u4"),
+    ("temp", "<i2"),
+    ("humidity", "u1"),
+    ("wind_direction", "u1"),
+    ("wind", "<u2"),
+    ("precipitation1h", "<u2"),
+])
+#列ごとの(倍率, 欠測値)
+COLUMNS = {
+    "temp": (10, np.iinfo(np.int16).min),
+    "humidity": (1, np.iinfo(np.uint8).max),
+    "wind_direction": (1, np.iinfo(np.uint8).max),
+    "wind": (10, np.iinfo(np.uint16).max),
+    "precipitation1h": (10, np.iinfo(np.uint16).max),
+}
+
+#気象庁の観測時刻は日本時間
+JST = timezone(timedelta(hours=9))
+
+
+#Amedas_dataのリストをレコードの配列にする(時刻の昇順)
+def encode(amedas_list) -> np.ndarray:
+    rows = sorted(amedas_list, key=lambda x: x.time)
+    records = np.zeros(len(rows), dtype=RECORD)
+    records["time"] = [int(r.time.timestamp()) for r in rows]
+    for name, (scale, missing) in COLUMNS.items():
+        #欠測値と重ならないよう、欠測値の側の端だけ1つ内側に収める
+        limits = np.iinfo(RECORD[name])
+        low = limits.min + 1 if missing == limits.min else limits.min
+        high = limits.max - 1 if missing == limits.max else limits.max
+        records[name] = [
+            missing if getattr(r, name) is None
+            else min(max(round(getattr(r, name) * scale), low), high)
+            for r in rows
+        ]
+    return records
+
+
+#レコードの配列を列データにする(欠測はNaN)
+def decode(records: np.ndarray, tz=JST) -> ObservationSeries:
+    columns = {}
+    for name, (scale, missing) in COLUMNS.items():
+        raw = records[name]
+        column = raw.astype(np.float64) / scale
+        column[raw == missing] = np.nan
+        columns[name] = column
+    return from_columns(time=records["time"].astype(np.float64), tz=tz, **columns)
+
+
+#1地点分のアーカイブファイル
+#書き込みは常駐プロセスの1か所だけから行い、読み出しは何か所からでもよい
+class StationArchive:
+    def __init__(self, path: str, station: str):
+        self.path = path
+        self.station = station
+        self._lock = threading.Lock()
+        self._records = None
+        self._size = None
+
+    def _header(self) -> bytes:
+        return HEADER.pack(MAGIC, VERSION, RECORD.itemsize, self.station.encode("ascii"))
+
+    def _check_header(self, head: bytes):
+        magic, version, record_size, station = HEADER.unpack(head)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"アメダスのアーカイブの形式が違います: {self.path}")
+        if station.rstrip(b"\0").decode("ascii") != self.station:
+            raise ValueError(f"別の地点のアーカイブです: {self.path}")
+
+    #ファイルを用意し、書き込み途中で終わった最後のレコードがあれば切り捨てる
+    def _prepare(self):
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self._header())
+            os.replace(tmp_path, self.path)
+            return
+        with open(self.path, "r+b") as f:
+            self._check_header(f.read(HEADER.size))
+            size = os.fstat(f.fileno()).st_size
+            extra = (size - HEADER.size) % RECORD.itemsize
+            if extra:
+                f.truncate(size - extra)
+
+    #ファイルの大きさが変わっていればメモリマップし直す
+    def _mapped(self) -> np.ndarray:
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            return np.zeros(0, dtype=RECORD)
+        if size != self._size:
+            count = max(0, size - HEADER.size) // RECORD.itemsize
+            if count:
+                with open(self.path, "rb") as f:
+                    self._check_header(f.read(HEADER.size))
+                self._records = np.memmap(self.path, dtype=RECORD, mode="r", offset=HEADER.size, shape=(count,))
+            else:
+                self._records = np.zeros(0, dtype=RECORD)
+            self._size = size
+        return self._records
+
+    def __len__(self):
+        return len(self._mapped())
+
+    #最後に記録した観測時刻(UNIX秒)。空ならNone
+    def last_time(self):
+        records = self._mapped()
+        return int(records["time"][-1]) if len(records) else None
+
+    #最後の記録より新しい観測だけを追記し、追記した件数を返す
+    def append(self, amedas_list) -> int:
+        with self._lock:
+            self._prepare()
+            records = encode([r for r in amedas_list if r is not None])
+            last = self.last_time()
+            if last is not None:
+                records = records[records["time"] > last]
+            if len(records):
+                #同じ時刻の観測が重なっていれば最初の1件だけ残す
+                records = records[np.concatenate(([True], np.diff(records["time"]) > 0))]
+                with open(self.path, "ab") as f:
+                    f.write(records.tobytes())
+            return len(records)
+
+    #時刻の範囲[start, end)のレコード(メモリマップの一部をそのまま参照する)
+    def records_between(self, start: datetime, end: datetime) -> np.ndarray:
+        records = self._mapped()
+        #records["time"]は飛び飛びの参照なので、np.searchsortedで列全体をコピーせずbisectで探す
+        times = records["time"]
+        lo = bisect_left(times, int(start.timestamp()))
+        hi = bisect_left(times, int(end.timestamp()), lo)
+        return records[lo:hi]
+
+    def between(self, start: datetime, end: datetime, tz=JST) -> ObservationSeries:
+        with metrics.stage("archive_query"):
+            return decode(self.records_between(start, end), tz)
+
+    #最後の記録からさかのぼってdurationの間の観測
+    def recent(self, duration: timedelta, tz=JST) -> ObservationSeries:
+        last = self.last_time()
+        if last is None:
+            return decode(np.zeros(0, dtype=RECORD), tz)
+        end = datetime.fromtimestamp(last + 1, tz=tz)
+        return self.between(end - duration, end, tz)
+
+
+#地点ごとのアーカイブをまとめて扱う
+class AmedasArchive:
+    def __init__(self, root: str = DEFAULT_ARCHIVE_DIR):
+        self.root = root
+        self._stations = {}
+        self._lock = threading.Lock()
+
+    def station(self, number: str) -> StationArchive:
+        with self._lock:
+            archive = self._stations.get(number)
+            if archive is None:
+                archive = self._stations[number] = StationArchive(os.path.join(self.root, f"{number}.bin"), number)
+            return archive
+
+    #{地点番号: Amedas_dataのリスト}をまとめて追記する
+    def append(self, observations: dict) -> int:
+        with metrics.stage("archive_append"):
+            return sum(self.station(number).append(rows) for number, rows in observations.items() if rows)
+
+
+_archive = None
+_enabled = None
+_archive_lock = threading.Lock()
+
+
+#有効ならAmedasArchive、無効ならNone
+def get_archive():
+    global _archive, _enabled
+    if _enabled is None:
+        with _archive_lock:
+            if _enabled is None:
+                load_dotenv()
+                enabled = (os.getenv("AMEDAS_ARCHIVE") or "0").lower() in ("1", "true", "yes")
+                root = os.getenv("AMEDAS_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR
+                _archive = AmedasArchive(root) if enabled else None
+                _enabled = enabled
+    return _archive
+
+
+if __name__ == "__main__":
+    #保存されている地点と期間を表示する(引数に地点番号を渡すとその地点だけ)
+    load_dotenv()
+    root = os.getenv("AMEDAS_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR
+    archive = AmedasArchive(root)
+    names = sys.argv[1:] or sorted(name[:-4] for name in os.listdir(root) if name.endswith(".bin"))
+    for number in names:
+        station = archive.station(number)
+        records = station.records_between(datetime.fromtimestamp(0, tz=JST), datetime.now(tz=JST) + timedelta(days=1))
+        if not len(records):
+            print(f"{number}: 記録なし")
+            continue
+        first = datetime.fromtimestamp(int(records["time"][0]), tz=JST)
+        last = datetime.fromtimestamp(int(records["time"][-1]), tz=JST)
+        print(f"{number}: {len(records)}件 {first:%Y-%m-%d %H:%M} 〜 {last:%Y-%m-%d %H:%M} "
+              f"({os.path.getsize(station.path)} bytes)")
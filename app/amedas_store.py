@@ -0,0 +1,118 @@
+import gzip
+import os
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+#キャッシュ設定の既定値(.envのAMEDAS_CACHE_DIR, AMEDAS_CACHE_MAX_MB, AMEDAS_CACHE_MAX_AGE_Hで上書き可能)
+DEFAULT_CACHE_DIR = "cache/amedas"
+DEFAULT_MAX_MB = 50.0
+DEFAULT_MAX_AGE_H = 48.0
+
+KEY_FORMAT = "%Y%m%d%H%M00"
+
+
+#公開済みのアメダス全国スナップショット(map/{時刻}.json)をディスクに保存する
+#一度公開されたスナップショットは変わらないので、時刻をキーにそのまま再利用できる
+class SnapshotStore:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = None, max_age: timedelta = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    #観測時刻からキー(ファイル名)を作る
+    @staticmethod
+    def key(found_time: datetime) -> str:
+        return found_time.strftime(KEY_FORMAT)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json.gz")
+
+    def has(self, found_time: datetime) -> bool:
+        return os.path.exists(self._path(self.key(found_time)))
+
+    #保存済みならJSONのバイト列、無ければNoneを返す
+    def get(self, found_time: datetime):
+        path = self._path(self.key(found_time))
+        try:
+            with gzip.open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError):
+            #書き込み途中などで壊れたファイルは捨てて取り直す
+            self._remove(path)
+            return None
+
+    #スナップショットを保存してから古いものを掃除する
+    def put(self, found_time: datetime, raw: bytes):
+        path = self._path(self.key(found_time))
+        #別名で書いてから置き換え、読み手に書きかけのファイルを見せない
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    #保存期間を過ぎたもの、容量上限を超えた分を古い順に削除する
+    def evict(self, now: datetime = None):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    key_time = datetime.strptime(name[:-len(".json.gz")], KEY_FORMAT)
+                    size = os.path.getsize(path)
+                except (ValueError, OSError):
+                    continue
+                entries.append((key_time, size, path))
+            entries.sort()
+
+            if self.max_age is not None and entries:
+                #キーはタイムゾーン無しの現地時刻なので、最新の保存時刻を基準に判定する
+                if now is None:
+                    newest = entries[-1][0]
+                else:
+                    newest = now.replace(tzinfo=None)
+                limit = newest - self.max_age
+                while entries and entries[0][0] < limit:
+                    self._remove(entries.pop(0)[2])
+
+            if self.max_bytes is not None:
+                total = sum(size for _, size, _ in entries)
+                while entries and total > self.max_bytes:
+                    _, size, path = entries.pop(0)
+                    self._remove(path)
+                    total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+#.envの設定で共有のスナップショットストアを作る
+def get_snapshot_store() -> SnapshotStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            load_dotenv()
+            root = os.getenv("AMEDAS_CACHE_DIR") or DEFAULT_CACHE_DIR
+            max_mb = float(os.getenv("AMEDAS_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+            max_age_h = float(os.getenv("AMEDAS_CACHE_MAX_AGE_H") or DEFAULT_MAX_AGE_H)
+            _store = SnapshotStore(
+                root=root,
+                max_bytes=int(max_mb * 1024 * 1024),
+                max_age=timedelta(hours=max_age_h)
+            )
+        return _store
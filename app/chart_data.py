@@ -0,0 +1,83 @@
+import json
+import math
+from datetime import datetime
+
+import weather as wt
+from observation import build_observation_series
+import metrics
+from weather_graph import WINDOW_HOURS
+
+#グラフのデータをブラウザで描くための列指向JSON(matplotlibは使わない)
+#時刻はUNIX秒の整数配列、値は小数1桁に丸め、欠測はnull
+#ダッシュボード画像(weather_graph.DashboardRenderer)と同じ系列を含む
+#  observed: アメダスの気温・体感温度・湿度・風速・風向(16方位)・降水量
+#  forecast: 補間した気温・降水確率
+#現在時刻の線・表示範囲・過ぎた降水確率の除外はブラウザが自分の時計で行うので、
+#データが変わったときだけ作り直せばよい
+CHART_VERSION = 1
+
+
+#digitsがNoneなら整数にする
+def _values(column, digits=1):
+    return [None if math.isnan(v) else round(v, digits) for v in column.tolist()]
+
+
+#観測の列データ(ObservationSeries)をJSONにする形
+def observed_columns(series) -> dict:
+    return {
+        "t": [int(t) for t in series.time.tolist()],
+        "temp": _values(series.temp),
+        "apparent_temp": _values(series.apparent_temp),
+        "humidity": _values(series.humidity, None),
+        "wind": _values(series.wind),
+        "wind_direction": _values(series.wind_direction, None),
+        "precipitation1h": _values(series.precipitation1h),
+    }
+
+
+def _points(points):
+    if not points:
+        return {"t": [], "v": []}
+    return {"t": [int(p.time.timestamp()) for p in points], "v": [round(p.value, 1) for p in points]}
+
+
+#render()と同じ引数からグラフのデータを作る
+def chart_payload(past_data, intr_temps, intr_pops, forecast_info, umbrella, now=None) -> dict:
+    tz = past_data[0].time.tzinfo
+    if now is None:
+        now = datetime.now(tz=tz)
+
+    # 画像と同じく、最初の1件を除いて古い順の列データにする
+    series = build_observation_series(past_data[1:])
+    return {
+        "v": CHART_VERSION,
+        "generated": int(now.timestamp()),
+        "utc_offset": int(now.utcoffset().total_seconds()) if now.utcoffset() else 0,
+        "window_hours": WINDOW_HOURS,
+        "location": forecast_info.location_name,
+        "weather": {"code": forecast_info.weather_codes[0], "text": forecast_info.weather[0]},
+        "umbrella": umbrella._asdict(),
+        "observed": observed_columns(series),
+        "forecast": {
+            "temps": _points(intr_temps),
+            "pops": _points(intr_pops),
+        },
+    }
+
+
+#区切りの空白を省いたJSONのバイト列
+def chart_json(past_data, intr_temps, intr_pops, forecast_info, umbrella, now=None) -> bytes:
+    with metrics.stage("render_chart"):
+        payload = chart_payload(past_data, intr_temps, intr_pops, forecast_info, umbrella, now)
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    metrics.add_bytes("render_chart", len(body))
+    return body
+
+
+if __name__ == "__main__":
+    past_data = wt.collect_12th_amedas00()
+    forecast_info = wt.get_weather_forcast()
+    intr_temps = wt.interpolate_forecast(forecast_info.temps, "temps", past_data)
+    intr_pops = wt.interpolate_forecast(forecast_info.pops, "pops")
+    umbrella = wt.judge_umbrella_necessity(intr_pops)
+    print(chart_json(past_data, intr_temps, intr_pops, forecast_info, umbrella).decode("utf-8"))
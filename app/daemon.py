@@ -0,0 +1,296 @@
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+import weather as wt
+import train
+import metrics
+import weather_graph as wg
+import chart_data
+from forecast_client import get_forecast_client
+from amedas_archive import get_archive
+
+#まだ更新されていなかったとき・取得に失敗したときの再試行間隔
+RETRY_INTERVAL = timedelta(seconds=30)
+#予報の定時発表からこれだけ待って確認する
+FORECAST_LAG = timedelta(minutes=2)
+#列車パネルの更新間隔
+TRAIN_INTERVAL = timedelta(seconds=1)
+#グラフの出力方法(.envのDASHBOARD_RENDER_MODEで変更可能)
+#  png  : サーバーでmatplotlibを使って画像を描く
+#  chart: グラフのデータ(chart_data)だけを作り、ブラウザで描く。matplotlibは読み込まない
+#  both : 両方
+RENDER_MODES = ("png", "chart", "both")
+DEFAULT_RENDER_MODE = "png"
+#計測が有効(METRICS_ENABLED=1)なとき、終わるたびに計測の差分を1行のJSONで出力するジョブ
+#(.envのMETRICS_LOG_JOBSにカンマ区切りで指定。noneで出力しない)
+DEFAULT_METRICS_LOG_JOBS = "amedas,forecast,render"
+
+
+#ジョブごとに自分の次回実行時刻を返す簡単なスケジューラ
+#ジョブはスレッドプールで実行し、同じジョブが重なって動くことはない
+class Scheduler:
+    def __init__(self, max_workers: int = 4, log_jobs=()):
+        self.log_jobs = set(log_jobs)
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = set()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    #func()は次回の実行時刻(datetime)を返す。Noneを返すとそのジョブは終わる
+    def add(self, name: str, func, first_run: datetime = None):
+        with self._cond:
+            when = first_run or datetime.now().astimezone()
+            heapq.heappush(self._queue, (when, next(self._counter), name, func))
+            self._cond.notify()
+
+    def _run(self, name, func):
+        start = time.perf_counter()
+        try:
+            with metrics.stage(f"job_{name}"):
+                next_run = func()
+        except Exception as e:
+            print(f"ジョブ{name}でエラーが発生しました: {e}")
+            next_run = datetime.now().astimezone() + RETRY_INTERVAL
+        if name in self.log_jobs:
+            metrics.get_metrics().log_line(name, time.perf_counter() - start)
+        with self._cond:
+            self._running.discard(name)
+            if next_run is not None:
+                heapq.heappush(self._queue, (next_run, next(self._counter), name, func))
+            self._cond.notify()
+
+    def run_forever(self, stop_event: threading.Event = None):
+        stop_event = stop_event or threading.Event()
+        with self._cond:
+            while not stop_event.is_set():
+                now = datetime.now().astimezone()
+                if self._queue and self._queue[0][0] <= now:
+                    when, order, name, func = heapq.heappop(self._queue)
+                    #実行中なら終わってから改めて予定に入る
+                    if name in self._running:
+                        continue
+                    self._running.add(name)
+                    self._executor.submit(self._run, name, func)
+                    continue
+                timeout = (self._queue[0][0] - now).total_seconds() if self._queue else None
+                self._cond.wait(timeout=min(timeout, 1.0) if timeout is not None else 1.0)
+        self._executor.shutdown(wait=False)
+
+
+#常駐プロセス
+#重いライブラリの読み込みや接続は起動時の1回だけで、各データは自分の更新周期で取り直す
+#  amedas  : latest_time.txtの時刻に合わせて10分ごと
+#  forecast: 気象庁の定時発表(5,11,17時)の後だけ
+#  trains  : 1秒ごと
+#  render  : 入力(観測・予報・表示する時刻の分)が変わったときだけ
+class DashboardDaemon:
+    def __init__(self, output_path: str = wg.OUTPUT_PATH):
+        load_dotenv()
+        self.output_path = output_path
+        #アメダスはlatest_time.txtの時刻から間隔+遅れ(.envのAMEDAS_LAG_SEC)だけ待って確認する
+        self.amedas_lag = wt.amedas_lag()
+        self.render_mode = os.getenv("DASHBOARD_RENDER_MODE") or DEFAULT_RENDER_MODE
+        if self.render_mode not in RENDER_MODES:
+            print(f"DASHBOARD_RENDER_MODEが不正です({self.render_mode})。{DEFAULT_RENDER_MODE}で描画します")
+            self.render_mode = DEFAULT_RENDER_MODE
+        log_jobs = ()
+        if metrics.get_metrics() is not None:
+            log_jobs = (os.getenv("METRICS_LOG_JOBS") or DEFAULT_METRICS_LOG_JOBS).split(",")
+        self.scheduler = Scheduler(log_jobs=[job.strip() for job in log_jobs if job.strip() != "none"])
+        self.lock = threading.Lock()
+        self._render_lock = threading.Lock()
+
+        self.amedas_time = None
+        self.past_data = None
+        self.forecast_info = None
+        self.intr_temps = None
+        self.intr_pops = None
+        self.umbrella = None
+        self.trains = None
+        self.dashboard_png = None
+        self.dashboard_etag = None
+        self.chart_json = None
+        self.chart_etag = None
+        self._render_key = None
+        self._chart_key = None
+        self._listeners = []
+
+    #状態が変わったときにlistener(topic, value)を呼ぶ
+    #topic: "trains", "amedas", "umbrella", "dashboard"(値は画像のETag), "chart"(値はグラフデータのETag)
+    #更新処理のスレッドから呼ぶので、listenerはすぐに戻ること
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, topic, value):
+        for listener in self._listeners:
+            try:
+                listener(topic, value)
+            except Exception as e:
+                print(f"{topic}の通知でエラーが発生しました: {e}")
+
+    def refresh_amedas(self):
+        now = datetime.now().astimezone()
+        base_time = wt.amedas_now_time()
+        if base_time is None or base_time == self.amedas_time:
+            #まだ次の観測が公開されていない
+            return now + RETRY_INTERVAL
+
+        #保存済みのスナップショットは使い回すので、通常は最新の1件だけダウンロードする
+        past_data = wt.collect_12th_amedas00(base_time=base_time)
+        if not past_data or past_data[0].time != base_time:
+            #最新の観測を取得できなかったときは前回のデータを表示したまま再試行する
+            print(f"{base_time:%H:%M}の観測を取得できないため前回のデータを使います")
+            return now + RETRY_INTERVAL
+        with self.lock:
+            self.amedas_time = base_time
+            self.past_data = past_data
+            self._derive()
+        self._archive(past_data)
+        #先頭が最新の観測。配信側は内容が変わったときだけ送る
+        self._notify("amedas", past_data[0])
+        self.render()
+        return max(now + RETRY_INTERVAL, base_time + wt.AMEDAS_INTERVAL + self.amedas_lag)
+
+    #アーカイブが有効なら、まだ記録していない観測(通常は最新の1件)を追記する
+    def _archive(self, past_data):
+        archive = get_archive()
+        if archive is None:
+            return
+        try:
+            station = archive.station(wt.default_amedas_number())
+            #先頭が最新の観測。記録済みなら何もしない(キャッシュから作ったデータのときなど)
+            last = station.last_time()
+            if last is not None and past_data[0].time.timestamp() <= last:
+                return
+            archive.append({station.station: past_data})
+        except (OSError, ValueError) as e:
+            print(f"アメダスの観測をアーカイブに記録できません: {e}")
+
+    def refresh_forecast(self):
+        now = datetime.now().astimezone()
+        forecast_info = wt.get_weather_forcast()
+        with self.lock:
+            changed = forecast_info != self.forecast_info
+            self.forecast_info = forecast_info
+            if changed:
+                self._derive()
+        if changed:
+            self.render()
+
+        #次の定時発表の少し後、発表が遅れていれば再確認の間隔で問い合わせる
+        next_check = get_forecast_client().next_check_time(wt.load_forecast_settings().meso_area_code)
+        if next_check is None:
+            return now + RETRY_INTERVAL
+        return max(now + RETRY_INTERVAL, next_check + FORECAST_LAG)
+
+    #観測と予報から補間・傘判定を計算し直す(self.lockを持って呼ぶ)
+    def _derive(self):
+        if not self.past_data or not self.forecast_info:
+            return
+        self.intr_temps = wt.interpolate_forecast(self.forecast_info.temps, "temps", self.past_data)
+        self.intr_pops = wt.interpolate_forecast(self.forecast_info.pops, "pops")
+        umbrella = wt.judge_umbrella_necessity(self.intr_pops) if self.intr_pops else None
+        if umbrella != self.umbrella:
+            self.umbrella = umbrella
+            self._notify("umbrella", umbrella)
+
+    def refresh_trains(self):
+        now = datetime.now()
+        trains = train.upcoming_train(train.train_context(now))
+        with self.lock:
+            changed = trains != self.trains
+            self.trains = trains
+        if changed:
+            self.on_trains_changed(trains)
+            self._notify("trains", trains)
+        #次の秒の頭に合わせる
+        return (now + TRAIN_INTERVAL).replace(microsecond=0).astimezone()
+
+    def on_trains_changed(self, trains):
+        print("--- 次に乗れる電車 ---")
+        for i, t in enumerate(trains, 1):
+            status = "徒歩OK" if t.success_walk else "ダッシュ推奨"
+            print(f"{i}: {t.train_time}発 {t.train_type}({t.train_destination}行) [{status}]")
+
+    #入力が変わったときだけダッシュボードの画像・グラフデータを作り直す
+    def render(self):
+        with self.lock:
+            if not (self.past_data and self.forecast_info and self.intr_temps and self.intr_pops and self.umbrella):
+                return False
+            args = (self.past_data, self.intr_temps, self.intr_pops, self.forecast_info, self.umbrella)
+            amedas_time = self.amedas_time
+        rendered = False
+        if self.render_mode in ("chart", "both"):
+            rendered = self._render_chart(args, amedas_time)
+        if self.render_mode in ("png", "both"):
+            rendered = self._render_png(args, amedas_time) or rendered
+        return rendered
+
+    #グラフデータは時刻に依存しないので、観測か予報が変わったときだけ作る
+    def _render_chart(self, args, amedas_time):
+        key = (amedas_time, args[3])
+        with self._render_lock:
+            if key == self._chart_key:
+                return False
+            body = chart_data.chart_json(*args)
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            with self.lock:
+                self.chart_json = body
+                self.chart_etag = etag
+            self._chart_key = key
+        self._notify("chart", etag)
+        return True
+
+    def _render_png(self, args, amedas_time):
+        tz = args[0][0].time.tzinfo
+        now = datetime.now(tz=tz)
+        #画面に出る時刻は分単位なので、同じ分の間は描き直さない
+        key = (amedas_time, args[3], now.strftime('%Y%m%d%H%M'))
+
+        with self._render_lock:
+            if key == self._render_key:
+                return False
+            png = wg.get_renderer().render(*args, now=now)
+            #output_pathがNoneならファイルには書かず、メモリ上の画像だけを更新する
+            if self.output_path:
+                with open(self.output_path, 'wb') as f:
+                    f.write(png)
+            etag = '"' + hashlib.sha1(png).hexdigest()[:16] + '"'
+            with self.lock:
+                self.dashboard_png = png
+                self.dashboard_etag = etag
+            self._render_key = key
+        self._notify("dashboard", etag)
+        return True
+
+    #分が変わったら時刻表示と現在線のために描き直す(グラフデータは時刻で変わらない)
+    def _render_job(self):
+        if self.render_mode == "chart":
+            return None
+        self.render()
+        now = datetime.now().astimezone()
+        return now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+    def start(self):
+        if self.render_mode != "chart":
+            wg.preload_icons()
+        self.scheduler.add("amedas", self.refresh_amedas)
+        self.scheduler.add("forecast", self.refresh_forecast)
+        self.scheduler.add("trains", self.refresh_trains)
+        self.scheduler.add("render", self._render_job)
+
+    def run_forever(self, stop_event: threading.Event = None):
+        self.start()
+        self.scheduler.run_forever(stop_event)
+
+
+if __name__ == "__main__":
+    DashboardDaemon().run_forever()
@@ -0,0 +1,118 @@
+import threading
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from utils import StaleWhileRevalidate, jma_url, polite_get
+import metrics
+
+FORECAST_PATH = "/bosai/forecast/data/forecast/{code}.json"
+
+#気象庁が府県天気予報を定時発表する時刻(日本時間)
+PUBLISH_HOURS = (5, 11, 17)
+
+#定時発表を過ぎても更新が無いときに再確認する間隔
+DEFAULT_REVALIDATE_INTERVAL = timedelta(minutes=10)
+
+
+#キャッシュしている予報JSONと再検証用の情報
+class CachedForecast(NamedTuple):
+    data: list
+    report_time: datetime
+    etag: str
+    last_modified: str
+    checked_at: datetime
+
+
+#報告時刻の次に予定されている定時発表の時刻
+def next_publish_time(report_time: datetime) -> datetime:
+    for hour in PUBLISH_HOURS:
+        candidate = report_time.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if candidate > report_time:
+            return candidate
+    tomorrow = report_time + timedelta(days=1)
+    return tomorrow.replace(hour=PUBLISH_HOURS[0], minute=0, second=0, microsecond=0)
+
+
+#予報JSON(forecast/{府県コード}.json)の取得クライアント
+#発表時刻(reportDatetime)から次の定時発表までは通信せずキャッシュを返し、
+#それ以降は条件付きリクエスト(ETag / If-Modified-Since)で更新の有無だけを確認する
+#確認が遅い・失敗したときは前回の予報を返す(StaleWhileRevalidate)
+class ForecastClient:
+    def __init__(self, revalidate_interval: timedelta = DEFAULT_REVALIDATE_INTERVAL, stale_wait: float = None):
+        self.revalidate_interval = revalidate_interval
+        self._cache = StaleWhileRevalidate(wait=stale_wait)
+
+    def get(self, meso_area_code: str, now: datetime = None) -> list:
+        if now is None:
+            now = datetime.now().astimezone()
+
+        def is_fresh(cached):
+            fresh = not self._is_stale(cached, now)
+            if fresh:
+                metrics.cache_hit("forecast")
+            return fresh
+
+        with metrics.stage("forecast"):
+            cached = self._cache.get(
+                meso_area_code,
+                lambda previous: self._fetch(meso_area_code, previous, now),
+                is_fresh
+            )
+        return cached.data
+
+    #次に問い合わせが必要になる時刻(未取得ならNone)
+    def next_check_time(self, meso_area_code: str):
+        cached = self._cache.peek(meso_area_code)
+        if cached is None:
+            return None
+        publish = next_publish_time(cached.report_time)
+        if cached.checked_at < publish:
+            return publish
+        return cached.checked_at + self.revalidate_interval
+
+    #次の定時発表前ならキャッシュは新しい。発表後は再確認の間隔をあけて問い合わせる
+    def _is_stale(self, cached: CachedForecast, now: datetime) -> bool:
+        if now < next_publish_time(cached.report_time):
+            return False
+        return now - cached.checked_at >= self.revalidate_interval
+
+    def _fetch(self, meso_area_code: str, cached: CachedForecast, now: datetime) -> CachedForecast:
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        response = polite_get(jma_url(FORECAST_PATH.format(code=meso_area_code)), headers=headers)
+        #更新が無ければ確認時刻だけ進める
+        if cached and response.status_code == 304:
+            metrics.cache_hit("forecast")
+            return cached._replace(checked_at=now)
+        response.raise_for_status()
+
+        metrics.cache_miss("forecast")
+        metrics.add_bytes("forecast", len(response.content))
+        data = response.json()
+        return CachedForecast(
+            data=data,
+            report_time=datetime.fromisoformat(data[0]["reportDatetime"]),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            checked_at=now
+        )
+
+    #キャッシュを捨てて次回は必ず取得し直す
+    def clear(self):
+        self._cache.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+#プロセス内で共有する予報クライアント
+def get_forecast_client() -> ForecastClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ForecastClient()
+        return _client
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import metrics
+
+#補間方法: 気温は秋間補間、降水確率はPCHIP補間(scipy.interpolateのクラス名)
+INTERPOLATORS = {
+    "temps": "Akima1DInterpolator",
+    "pops": "PchipInterpolator",
+}
+
+#値の取りうる範囲
+CLIP_RANGES = {
+    "pops": (0.0, 100.0),
+}
+
+#保持しておくフィット済み曲線の数
+MAX_CACHED_CURVES = 16
+
+
+#予報の節点(UNIX秒, 値)にフィットした補間曲線
+#フィットは作成時の1回だけで、evaluateは指定範囲の格子点をまとめて計算する
+class ForecastCurve:
+    def __init__(self, times, values, mode: str, origin: float = None):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.mode = mode
+        self.start = float(self.times[0])
+        self.end = float(self.times[-1])
+        #評価を始める時刻(格子もこの時刻にそろえる)
+        self.origin = self.start if origin is None else float(origin)
+        #scipyはフィットするときに初めて読み込む
+        from scipy import interpolate
+        self._func = getattr(interpolate, INTERPOLATORS[mode])(self.times, self.values)
+
+    #t0からt1までstep秒刻みの(時刻, 値)をNumPy配列で返す
+    #格子点はanchor(省略時はorigin)からstepの倍数の位置にそろえる
+    def evaluate(self, t0: float = None, t1: float = None, step: float = 3600, anchor: float = None):
+        if anchor is None:
+            anchor = self.origin
+        lo = self.origin if t0 is None else max(float(t0), self.start)
+        hi = self.end if t1 is None else min(float(t1), self.end)
+        first = lo + (anchor - lo) % step
+        times = np.arange(first, hi + 1, step, dtype=np.float64)
+        values = self._func(times)
+        if self.mode in CLIP_RANGES:
+            values = np.clip(values, *CLIP_RANGES[self.mode])
+        return times, np.round(values, 1)
+
+
+_curves = OrderedDict()
+_curves_lock = threading.Lock()
+
+
+#同じ節点の曲線はフィットし直さずにキャッシュから返す(予報が再発表されるまで節点は変わらない)
+def fit_curve(times, values, mode: str, origin: float = None) -> ForecastCurve:
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    key = (mode, origin, times.tobytes(), values.tobytes())
+    with _curves_lock:
+        curve = _curves.get(key)
+        if curve is not None:
+            _curves.move_to_end(key)
+            metrics.cache_hit("curve_fit")
+            return curve
+
+    metrics.cache_miss("curve_fit")
+    with metrics.stage("curve_fit"):
+        curve = ForecastCurve(times, values, mode, origin)
+    with _curves_lock:
+        _curves[key] = curve
+        while len(_curves) > MAX_CACHED_CURVES:
+            _curves.popitem(last=False)
+    return curve
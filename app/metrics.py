@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+#処理段階ごとの計測(.envのMETRICS_ENABLED=1で有効)
+#無効のときはstage()が何もしないオブジェクトを返し、その他の関数もすぐに戻る
+#記録する値(段階ごとの累計):
+#  calls, errors, seconds(合計), max_seconds, bytes(ダウンロード・出力した量), hits/misses(キャッシュ)
+PROMETHEUS_PREFIX = "dashboard"
+
+
+class StageStats:
+    __slots__ = ("calls", "errors", "seconds", "max_seconds", "bytes", "hits", "misses")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Metrics:
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._last_log = {}
+
+    def _stats(self, name) -> StageStats:
+        stats = self._stages.get(name)
+        if stats is None:
+            stats = self._stages[name] = StageStats()
+        return stats
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            stats = self._stats(name)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if error:
+                stats.errors += 1
+
+    def add(self, name, field, amount=1):
+        with self._lock:
+            stats = self._stats(name)
+            setattr(stats, field, getattr(stats, field) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stages.items())}
+
+    #Prometheusのテキスト形式
+    def prometheus_text(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for field, kind, help_text in [
+            ("calls", "counter", "処理の回数"),
+            ("errors", "counter", "例外で終わった回数"),
+            ("seconds", "counter", "処理時間の合計(秒)"),
+            ("max_seconds", "gauge", "1回の処理時間の最大(秒)"),
+            ("bytes", "counter", "ダウンロード・出力したバイト数"),
+            ("hits", "counter", "キャッシュを使った回数"),
+            ("misses", "counter", "キャッシュに無かった回数"),
+        ]:
+            metric = f"{PROMETHEUS_PREFIX}_stage_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in snapshot.items():
+                lines.append(f'{metric}{{stage="{name}"}} {stats[field]}')
+        return "\n".join(lines) + "\n"
+
+    #前回からの差分を1行のJSONで出力する(変化の無かった段階は省く)
+    #複数のジョブが同時に終わっても同じ差分を二重に出さないよう、差分の計算と前回分の更新はロックの中で行う
+    def log_line(self, job, seconds):
+        stages = {}
+        with self._lock:
+            snapshot = {name: stats.as_dict() for name, stats in sorted(self._stages.items())}
+            for name, stats in snapshot.items():
+                last = self._last_log.get(name, {})
+                delta = {field: value - last.get(field, 0) for field, value in stats.items() if field != "max_seconds"}
+                if delta["calls"] or delta["hits"] or delta["misses"] or delta["bytes"]:
+                    delta["seconds"] = round(delta["seconds"], 4)
+                    stages[name] = {field: value for field, value in delta.items() if value}
+            self._last_log = snapshot
+        print(json.dumps({"ts": round(time.time(), 3), "job": job, "seconds": round(seconds, 4), "stages": stages},
+                         ensure_ascii=False))
+
+
+#計測が無効なときに使う何もしないコンテキストマネージャ
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start, error=exc_type is not None)
+        return False
+
+
+_NOOP = _NoopStage()
+_metrics = None
+_enabled = None
+_init_lock = threading.Lock()
+
+
+#有効ならMetrics、無効ならNone
+def get_metrics():
+    global _metrics, _enabled
+    if _enabled is None:
+        with _init_lock:
+            if _enabled is None:
+                load_dotenv()
+                enabled = (os.getenv("METRICS_ENABLED") or "0").lower() in ("1", "true", "yes")
+                _metrics = Metrics() if enabled else None
+                _enabled = enabled
+    return _metrics
+
+
+#with stage("名前"): で処理時間・回数・例外を記録する
+def stage(name):
+    metrics = get_metrics()
+    if metrics is None:
+        return _NOOP
+    return _Stage(metrics, name)
+
+
+def add_bytes(name, amount):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.add(name, "bytes", amount)
+
+
+def cache_hit(name):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.add(name, "hits")
+
+
+def cache_miss(name):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.add(name, "misses")
+
+
+def count_error(name):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.add(name, "errors")
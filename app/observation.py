@@ -0,0 +1,91 @@
+from datetime import datetime, timezone, tzinfo
+from typing import NamedTuple
+import numpy as np
+
+
+#Steadmanの式による体感温度(配列でまとめて計算する)
+def apparent_temp_array(temp, humidity, wind):
+    temp = np.asarray(temp, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    wind = np.asarray(wind, dtype=np.float64)
+    # 飽和水蒸気圧 E (hPa) を計算（テッテンスの式）
+    e_sat = 6.1078 * np.power(10.0, (7.5 * temp) / (temp + 237.3))
+    # 現在の水蒸気圧 e (hPa) を計算
+    e_abs = e_sat * (humidity / 100)
+    # AT = T + 0.33 * e - 0.70 * v - 4.00
+    return np.round(temp + (0.33 * e_abs) - (0.70 * wind) - 4.00, 1)
+
+
+#風向(16方位, 0:静穏 4:東 8:南 ...)から矢印のベクトル(u, v)を計算する
+#風向は「吹いてくる方向」なのでベクトルを反転させる
+def wind_vectors(wind_direction):
+    rad = np.asarray(wind_direction, dtype=np.float64) * (np.pi / 8)
+    return -np.sin(rad), -np.cos(rad)
+
+
+#アメダス観測データの列指向コンテナ
+#時刻はUNIX秒(float64)、欠測はNaN。体感温度と風向ベクトルは作成時に1回だけ計算する
+class ObservationSeries(NamedTuple):
+    time: np.ndarray
+    temp: np.ndarray
+    humidity: np.ndarray
+    wind: np.ndarray
+    wind_direction: np.ndarray
+    precipitation1h: np.ndarray
+    apparent_temp: np.ndarray
+    wind_u: np.ndarray
+    wind_v: np.ndarray
+    tz: tzinfo
+
+    def __len__(self):
+        return len(self.time)
+
+    #matplotlibにそのまま渡せるdatetime64(UTC)の配列
+    @property
+    def datetimes(self) -> np.ndarray:
+        return (self.time * 1000).astype("datetime64[ms]")
+
+    #i番目の観測時刻(元データのタイムゾーン付き)
+    def datetime_at(self, i: int) -> datetime:
+        return datetime.fromtimestamp(float(self.time[i]), tz=self.tz)
+
+    #時刻の範囲[start, end)で切り出す
+    def between(self, start: datetime, end: datetime) -> "ObservationSeries":
+        lo, hi = np.searchsorted(self.time, [start.timestamp(), end.timestamp()])
+        return ObservationSeries(*(column[lo:hi] for column in self[:-1]), self.tz)
+
+
+def _column(values) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+#Amedas_dataのリストから時刻順の列データを作る
+def build_observation_series(amedas_list) -> ObservationSeries:
+    records = sorted(amedas_list, key=lambda x: x.time)
+    tz = records[0].time.tzinfo if records else timezone.utc
+    return from_columns(
+        time=np.array([r.time.timestamp() for r in records], dtype=np.float64),
+        temp=_column(r.temp for r in records),
+        humidity=_column(r.humidity for r in records),
+        wind=_column(r.wind for r in records),
+        wind_direction=_column(r.wind_direction for r in records),
+        precipitation1h=_column(r.precipitation1h for r in records),
+        tz=tz
+    )
+
+
+#列の配列から体感温度と風向ベクトルを付けたコンテナを作る
+def from_columns(time, temp, humidity, wind, wind_direction, precipitation1h, tz) -> ObservationSeries:
+    wind_u, wind_v = wind_vectors(wind_direction)
+    return ObservationSeries(
+        time=np.asarray(time, dtype=np.float64),
+        temp=np.asarray(temp, dtype=np.float64),
+        humidity=np.asarray(humidity, dtype=np.float64),
+        wind=np.asarray(wind, dtype=np.float64),
+        wind_direction=np.asarray(wind_direction, dtype=np.float64),
+        precipitation1h=np.asarray(precipitation1h, dtype=np.float64),
+        apparent_temp=apparent_temp_array(temp, humidity, wind),
+        wind_u=wind_u,
+        wind_v=wind_v,
+        tz=tz
+    )
@@ -0,0 +1,232 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Tuple
+from dotenv import load_dotenv
+
+import weather as wt
+import metrics
+
+#複数の画面(地点・アメダス地点・大きさ・解像度・出力先)のダッシュボードをまとめて描く
+#気象庁のデータは全画面で1回だけ取得し(アメダスは1時刻1回のダウンロードで全地点を取り出す、
+#予報は府県ごとに1回)、描画はプロセスプールで画面ごとに並列に行う
+#matplotlibの描画はCPUを使い続けGILを離さないので、スレッドではなくプロセスに分ける
+#
+#画面の設定ファイル(.envのSCREEN_PROFILES、既定はscreens.json)はJSONの配列:
+#  [
+#    {"name": "hall", "size": [11, 9], "dpi": 150, "output": "img/hall.png"},
+#    {"name": "kitchen", "location_name": "福岡", "meso_area_code": "400000", "local_area_code": "400010",
+#     "city_code": "82182", "amedas_number": "82182", "size": [8, 6], "dpi": 100}
+#  ]
+#  省略した地点の項目は.envの値、sizeは[11, 9]、dpiは150、outputはimg/{name}.png
+#  outputをnullにするとファイルには書かず、PNGのバイト列を結果で返す
+DEFAULT_PROFILES_PATH = "screens.json"
+DEFAULT_FIGSIZE = (11, 9)
+DEFAULT_DPI = 150
+
+
+class ScreenProfile(NamedTuple):
+    name: str
+    location_name: str
+    meso_area_code: str
+    local_area_code: str
+    city_code: str
+    amedas_number: str
+    figsize: Tuple[float, float] = DEFAULT_FIGSIZE
+    dpi: int = DEFAULT_DPI
+    output: str = None
+
+    def forecast_settings(self) -> wt.ForecastSettings:
+        return wt.ForecastSettings(
+            location_name = self.location_name,
+            meso_area_code = self.meso_area_code,
+            local_area_code = self.local_area_code,
+            city_code = self.city_code
+        )
+
+
+#画面1つ分の描画結果(pngはoutputがNoneのときだけ入る)
+class RenderResult(NamedTuple):
+    name: str
+    output: str
+    size: int
+    seconds: float
+    png: bytes = None
+
+
+#画面の名前は描画の入力と結果の見分けに使うので、重複していればValueError
+def check_profile_names(profiles):
+    names = set()
+    for profile in profiles:
+        if profile.name in names:
+            raise ValueError(f"画面の名前が重複しています: {profile.name}")
+        names.add(profile.name)
+
+
+#画面の設定ファイルを読み込む
+def load_profiles(path=None):
+    load_dotenv()
+    path = path or os.getenv("SCREEN_PROFILES") or DEFAULT_PROFILES_PATH
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    defaults = wt.load_forecast_settings()
+    profiles = []
+    for entry in entries:
+        name = entry["name"]
+        profiles.append(ScreenProfile(
+            name = name,
+            location_name = entry.get("location_name", defaults.location_name),
+            meso_area_code = entry.get("meso_area_code", defaults.meso_area_code),
+            local_area_code = entry.get("local_area_code", defaults.local_area_code),
+            city_code = entry.get("city_code", defaults.city_code),
+            amedas_number = entry.get("amedas_number") or wt.default_amedas_number(),
+            figsize = tuple(entry.get("size", DEFAULT_FIGSIZE)),
+            dpi = int(entry.get("dpi", DEFAULT_DPI)),
+            output = entry.get("output", f"img/{name}.png")
+        ))
+    check_profile_names(profiles)
+    return profiles
+
+
+#全画面の描画に使うデータを1回の取得で揃え、{画面名: render()の引数}を返す
+#データが無い画面は含めない
+def collect_inputs(profiles, base_time=None) -> dict:
+    if base_time is None:
+        base_time = wt.amedas_now_time()
+    if not base_time:
+        print("最新情報の時刻データを取得できません")
+        return {}
+
+    stations = list(dict.fromkeys(profile.amedas_number for profile in profiles))
+    observations = wt.collect_12th_amedas00_many(stations, base_time=base_time)
+
+    #予報・降水確率・傘判定は地点の設定ごとに1回だけ作る
+    forecasts = {}
+    inputs = {}
+    for profile in profiles:
+        past_data = observations.get(profile.amedas_number)
+        if not past_data:
+            print(f"{profile.name}: アメダス({profile.amedas_number})の観測データがありません")
+            continue
+
+        settings = profile.forecast_settings()
+        if settings not in forecasts:
+            try:
+                forecast_info = wt.get_weather_forcast(settings)
+            except Exception as e:
+                print(f"{settings.location_name}の予報を取得できません: {e}")
+                forecasts[settings] = None
+            else:
+                intr_pops = wt.interpolate_forecast(forecast_info.pops, "pops")
+                forecasts[settings] = (forecast_info, intr_pops, wt.judge_umbrella_necessity(intr_pops))
+        if forecasts[settings] is None:
+            continue
+
+        forecast_info, intr_pops, umbrella = forecasts[settings]
+        intr_temps = wt.interpolate_forecast(forecast_info.temps, "temps", past_data)
+        inputs[profile.name] = (past_data, intr_temps, intr_pops, forecast_info, umbrella)
+    return inputs
+
+
+#プロセスごとに(大きさ, 解像度)ごとの描画クラスを使い回す(背景の作り置きが効く)
+_renderers = {}
+
+
+def render_profile(profile: ScreenProfile, args, now=None) -> RenderResult:
+    import weather_graph as wg
+    key = (profile.figsize, profile.dpi)
+    renderer = _renderers.get(key)
+    if renderer is None:
+        renderer = _renderers[key] = wg.DashboardRenderer(figsize=profile.figsize, dpi=profile.dpi)
+
+    start = time.perf_counter()
+    png = renderer.render(*args, now=now)
+    if profile.output:
+        os.makedirs(os.path.dirname(profile.output) or ".", exist_ok=True)
+        with open(profile.output, 'wb') as f:
+            f.write(png)
+    return RenderResult(
+        name = profile.name,
+        output = profile.output,
+        size = len(png),
+        seconds = time.perf_counter() - start,
+        png = None if profile.output else png
+    )
+
+
+#画面の一覧をまとめて描くクラス
+#プロセスプールは最初の描画で起動して使い回す(各プロセスでmatplotlibの読み込みは1回だけ)
+#起動方法はspawnにする(データ取得のスレッドが動いている親プロセスをforkしない)
+#計測(metrics)は親プロセスの取得と描画全体(render_farm)だけを記録する
+class RenderFarm:
+    def __init__(self, profiles, max_workers: int = None):
+        self.profiles = list(profiles)
+        check_profile_names(self.profiles)
+        if max_workers is None:
+            load_dotenv()
+            max_workers = int(os.getenv("RENDER_WORKERS") or 0) or os.cpu_count() or 1
+        self.max_workers = max(1, min(max_workers, len(self.profiles)))
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None and self.max_workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    #データを1回取得して全画面を描く。描けた画面の結果を設定の順に返す
+    def render_all(self, now=None) -> list:
+        with metrics.stage("render_farm"):
+            inputs = collect_inputs(self.profiles)
+            jobs = [(profile, inputs[profile.name]) for profile in self.profiles if profile.name in inputs]
+            pool = self._executor()
+            if pool is None:
+                return [render_profile(profile, args, now) for profile, args in jobs]
+
+            futures = [(profile, pool.submit(render_profile, profile, args, now)) for profile, args in jobs]
+            results = []
+            for profile, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"{profile.name}の描画に失敗しました: {e}")
+            return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数の画面のダッシュボードをまとめて描く")
+    parser.add_argument("profiles", nargs="?", help=f"画面の設定ファイル(既定: {DEFAULT_PROFILES_PATH})")
+    parser.add_argument("--workers", type=int, help="描画するプロセスの数(既定: CPUの数)")
+    parser.add_argument("--every", type=float, help="指定した秒ごとに描き直し続ける")
+    args = parser.parse_args()
+
+    farm = RenderFarm(load_profiles(args.profiles), max_workers=args.workers)
+    try:
+        while True:
+            start = time.perf_counter()
+            results = farm.render_all()
+            elapsed = time.perf_counter() - start
+            for result in results:
+                print(f"{result.name}: {result.output} ({result.size} bytes, {result.seconds:.2f}秒)")
+            print(f"{len(results)}/{len(farm.profiles)}画面を{elapsed:.2f}秒で描きました({farm.max_workers}プロセス)")
+            if not args.every:
+                break
+            time.sleep(max(0.0, args.every - elapsed))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        farm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import csv
+import os
+import threading
+from datetime import date, timedelta
+
+#時刻表の置き場所と命名規則(schedule_{ダイヤ種別}.csv)
+TRAIN_DATA_DIR = "data/train_data"
+SCHEDULE_FILE = "schedule_{}.csv"
+
+#日付ごとのダイヤ種別を上書きするファイル(列: date,schedule 例: 2026-12-31,yearend)
+OVERRIDE_FILE = "calendar_override.csv"
+
+#ダイヤ種別
+WEEKDAY = "weekday"
+WEEKEND = "weekend"
+SATURDAY = "saturday"
+
+#先に計算しておく日数
+DEFAULT_DAYS = 366
+
+
+#運行日カレンダー
+#日付ごとのダイヤ種別を先にまとめて計算しておき、更新のたびの判定を辞書の参照1回にする
+#優先順位: 上書きファイル > 祝日・日曜(weekend) > 土曜(saturdayの時刻表があれば) > 平日(weekday)
+class ServiceCalendar:
+    def __init__(self, start: date, days: int = DEFAULT_DAYS, data_dir: str = TRAIN_DATA_DIR):
+        self.start = start
+        self.end = start + timedelta(days=days)
+        self.data_dir = data_dir
+        self.override_path = os.path.join(data_dir, OVERRIDE_FILE)
+        self.override_mtime = self._override_mtime()
+        self._schedule_ids = self._build()
+
+    def _override_mtime(self):
+        try:
+            return os.stat(self.override_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    #ダイヤ種別に対応する時刻表のパス
+    def csv_path(self, schedule_id: str) -> str:
+        return os.path.join(self.data_dir, SCHEDULE_FILE.format(schedule_id))
+
+    def has_schedule(self, schedule_id: str) -> bool:
+        return os.path.exists(self.csv_path(schedule_id))
+
+    def covers(self, day: date) -> bool:
+        return self.start <= day < self.end
+
+    #上書きファイルが作成・更新・削除されたらTrue
+    def is_outdated(self) -> bool:
+        return self._override_mtime() != self.override_mtime
+
+    #日付のダイヤ種別
+    def schedule_id(self, day: date) -> str:
+        return self._schedule_ids[day]
+
+    def _build(self):
+        #祝日判定はカレンダーを作るときだけ使うので、ここで読み込む
+        import jpholiday
+
+        holidays = {d for d, _ in jpholiday.between(self.start, self.end)}
+        saturday = SATURDAY if self.has_schedule(SATURDAY) else WEEKEND
+
+        schedule_ids = {}
+        day = self.start
+        while day < self.end:
+            #曜日を返す(0:月, 1:火, 2:水, 3:木, 4:金, 5:土, 6:日)
+            week = day.weekday()
+            if day in holidays or week == 6:
+                schedule_ids[day] = WEEKEND
+            elif week == 5:
+                schedule_ids[day] = saturday
+            else:
+                schedule_ids[day] = WEEKDAY
+            day += timedelta(days=1)
+
+        for day, schedule_id in self._load_overrides():
+            if day in schedule_ids:
+                schedule_ids[day] = schedule_id
+        return schedule_ids
+
+    def _load_overrides(self):
+        if self.override_mtime is None:
+            return []
+        overrides = []
+        with open(self.override_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                try:
+                    day = date.fromisoformat(row['date'].strip())
+                except ValueError:
+                    print(f"運行日の上書きの日付が不正です: {row['date']}")
+                    continue
+                schedule_id = row['schedule'].strip()
+                if not self.has_schedule(schedule_id):
+                    print(f"時刻表が見つからないため上書きを無視します: {day} {schedule_id}")
+                    continue
+                overrides.append((day, schedule_id))
+        return overrides
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+#dayとその前後の日を含む運行日カレンダーを返す
+#(範囲外になったときと上書きファイルが変わったときだけ作り直す)
+def get_service_calendar(day: date) -> ServiceCalendar:
+    global _calendar
+    with _calendar_lock:
+        if (_calendar is None or not _calendar.covers(day - timedelta(days=1))
+                or not _calendar.covers(day + timedelta(days=1)) or _calendar.is_outdated()):
+            #前日の時刻表も引けるように1日前から作る
+            _calendar = ServiceCalendar(day - timedelta(days=1))
+        return _calendar
@@ -0,0 +1,199 @@
+"""時刻表のバイナリ変換
+
+data/train_data/ の train_master.csv と schedule_*.csv を、メモリマップで読める
+1つのバイナリファイル(timetable.bin)にまとめる。
+
+使い方:
+    python app/timetable_bin.py           # 変換してCSVと一致するか確認する
+    python app/timetable_bin.py --verify  # 既存のtimetable.binをCSVと照合するだけ
+
+ファイル形式(リトルエンディアン):
+    ヘッダ      : マジック"KSTT", 版(u16), 文字列数(u16), マスタ数(u16), 時刻表数(u16)
+    文字列表    : 長さ(u16) + UTF-8 を文字列数ぶん(種別・行先・色・時刻表名を共有)
+    マスタ      : (種別, 行先, 色)の文字列番号(u16×3) をマスタ数ぶん
+    時刻表目次  : 時刻表名の文字列番号(u16), 本数(u32), データ位置(u32) を時刻表数ぶん
+    データ      : 4バイト境界から、発車時刻(0時からの分, u16)の配列とマスタ番号(u16)の配列
+"""
+import csv
+import mmap
+import os
+import struct
+import sys
+
+TRAIN_DATA_DIR = "data/train_data"
+MASTER_FILE = "train_master.csv"
+COMPILED_FILE = "timetable.bin"
+
+MAGIC = b"KSTT"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHH")
+STRING_LEN = struct.Struct("<H")
+MASTER_ENTRY = struct.Struct("<HHH")
+SCHEDULE_ENTRY = struct.Struct("<HII")
+
+
+#時刻表のCSVファイル名の一覧
+def schedule_files(data_dir=TRAIN_DATA_DIR):
+    return sorted(
+        name for name in os.listdir(data_dir)
+        if name.startswith("schedule_") and name.endswith(".csv")
+    )
+
+
+#CSVを読み込み、(列車マスタ, {時刻表名: [(分, マスタid), ...]})を返す
+#マスタに無い列車は除外し、発車時刻の昇順に並べる
+def read_csv_sources(data_dir=TRAIN_DATA_DIR):
+    master = {}
+    with open(os.path.join(data_dir, MASTER_FILE), 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            master[row['id']] = (row['type'], row['dest'], row['color'])
+
+    schedules = {}
+    for name in schedule_files(data_dir):
+        rows = []
+        with open(os.path.join(data_dir, name), 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row['master_id'] in master:
+                    rows.append((int(row['hour']) * 60 + int(row['min']), row['master_id']))
+        rows.sort(key=lambda r: r[0])
+        schedules[name] = rows
+    return master, schedules
+
+
+#CSVをバイナリに変換して書き出す
+def compile_timetable(data_dir=TRAIN_DATA_DIR, output_path=None):
+    if output_path is None:
+        output_path = os.path.join(data_dir, COMPILED_FILE)
+    master, schedules = read_csv_sources(data_dir)
+
+    #同じ文字列は1つにまとめて番号で参照する
+    strings = []
+    string_ids = {}
+    def intern(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    master_ids = {}
+    master_entries = []
+    for master_id, fields in master.items():
+        master_ids[master_id] = len(master_entries)
+        master_entries.append(tuple(intern(v) for v in fields))
+    schedule_names = [intern(name) for name in schedules]
+
+    head = bytearray(HEADER.pack(MAGIC, VERSION, len(strings), len(master_entries), len(schedules)))
+    for text in strings:
+        encoded = text.encode('utf-8')
+        head += STRING_LEN.pack(len(encoded)) + encoded
+    for entry in master_entries:
+        head += MASTER_ENTRY.pack(*entry)
+
+    #データ部の位置は目次の大きさが決まってから計算する
+    data_start = len(head) + SCHEDULE_ENTRY.size * len(schedules)
+    offset = data_start + (-data_start % 4)
+    directory = bytearray()
+    data = bytearray(b"\0" * (offset - data_start))
+    for name_id, rows in zip(schedule_names, schedules.values()):
+        directory += SCHEDULE_ENTRY.pack(name_id, len(rows), offset)
+        chunk = struct.pack(f"<{len(rows)}H", *(m for m, _ in rows))
+        chunk += struct.pack(f"<{len(rows)}H", *(master_ids[i] for _, i in rows))
+        chunk += b"\0" * (-len(chunk) % 4)
+        data += chunk
+        offset += len(chunk)
+
+    #書きかけのファイルを読まれないように別名で書いてから置き換える
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(head + directory + data)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+#バイナリ時刻表の読み込み(メモリマップ)
+#発車時刻とマスタ番号の配列はファイルを直接参照し、コピーしない
+class CompiledTimetable:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("バイナリ時刻表はリトルエンディアン環境でのみ読み込めます")
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+
+        magic, version, n_strings, n_master, n_schedules = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"バイナリ時刻表の形式が違います: {path}")
+        pos = HEADER.size
+
+        self.strings = []
+        for _ in range(n_strings):
+            (length,) = STRING_LEN.unpack_from(buf, pos)
+            pos += STRING_LEN.size
+            self.strings.append(str(buf[pos:pos + length], 'utf-8'))
+            pos += length
+
+        #マスタ番号 -> (種別, 行先, 色)。文字列は共有されたオブジェクトを指す
+        self.master = []
+        for _ in range(n_master):
+            self.master.append(tuple(self.strings[i] for i in MASTER_ENTRY.unpack_from(buf, pos)))
+            pos += MASTER_ENTRY.size
+
+        self._schedules = {}
+        for _ in range(n_schedules):
+            name_id, count, offset = SCHEDULE_ENTRY.unpack_from(buf, pos)
+            pos += SCHEDULE_ENTRY.size
+            minutes = buf[offset:offset + 2 * count].cast('H')
+            master_index = buf[offset + 2 * count:offset + 4 * count].cast('H')
+            self._schedules[self.strings[name_id]] = (minutes, master_index)
+        self._buf = buf
+
+    #メモリマップを閉じる(以降は時刻表の配列を使えない)
+    def close(self):
+        for minutes, master_index in self._schedules.values():
+            minutes.release()
+            master_index.release()
+        self._buf.release()
+        self._mm.close()
+
+    def names(self):
+        return list(self._schedules)
+
+    def has(self, name):
+        return name in self._schedules
+
+    #時刻表を(発車時刻の配列, マスタ番号の配列)で返す
+    def schedule(self, name):
+        return self._schedules[name]
+
+
+#バイナリ時刻表がCSVと同じ内容かを確かめ、違いの一覧を返す(空なら一致)
+def verify(data_dir=TRAIN_DATA_DIR, compiled_path=None):
+    if compiled_path is None:
+        compiled_path = os.path.join(data_dir, COMPILED_FILE)
+    master, schedules = read_csv_sources(data_dir)
+    compiled = CompiledTimetable(compiled_path)
+
+    errors = []
+    if sorted(compiled.names()) != sorted(schedules):
+        errors.append(f"時刻表の一覧が違います: {sorted(compiled.names())} != {sorted(schedules)}")
+    for name, rows in schedules.items():
+        if not compiled.has(name):
+            continue
+        minutes, master_index = compiled.schedule(name)
+        expected = [(m, master[i]) for m, i in rows]
+        actual = [(m, compiled.master[i]) for m, i in zip(minutes, master_index)]
+        if expected != actual:
+            errors.append(f"{name}: 内容がCSVと一致しません")
+    return errors
+
+
+if __name__ == "__main__":
+    if "--verify" not in sys.argv[1:]:
+        print(f"変換しました: {compile_timetable()}")
+    errors = verify()
+    for error in errors:
+        print(error)
+    print("CSVと一致しました" if not errors else "CSVと一致しません")
+    sys.exit(1 if errors else 0)
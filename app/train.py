@@ -1,9 +1,15 @@
 import csv
+import math
 import os
-from datetime import datetime, timedelta
-import jpholiday
+import threading
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from dotenv import load_dotenv
-from typing import NamedTuple
+from typing import Callable, NamedTuple, Sequence
+from service_calendar import get_service_calendar, WEEKDAY
+from timetable_bin import CompiledTimetable
+import metrics
 
 #クラス設計
 #個人設定の定義
@@ -18,6 +24,7 @@ class NowTime(NamedTuple):
     time: str
     weekend_holiday: bool
     today_csv: str
+    schedule_id: str
 
 #駅到達時刻の定義
 class ArivalTime(NamedTuple):
@@ -32,8 +39,41 @@ class TrainInfo(NamedTuple):
     train_color: str
     success_walk: bool
     success_dash: bool
+    #発車日時(画面側で残り時間を数えるために使う)
+    departure: datetime = None
 
-#個人設定の読み込み
+#1回の更新で使う時刻・設定・駅到達時刻(時計は1回だけ読む)
+class TrainContext(NamedTuple):
+    now: NowTime
+    settings: PersonalConfig
+    arival: ArivalTime
+
+#時刻表の1本分(列車マスタを結合済み)
+class Departure(NamedTuple):
+    minute: int    # 0時からの分(24時を過ぎた列車は1440以上)
+    train_type: str
+    train_destination: str
+    train_color: str
+    schedule_id: str = None    # 運行日のダイヤ種別(連続した時刻表で使う)
+
+#1つの運行日の時刻表
+#minutesは発車時刻(0時からの分)の昇順配列、departure(i)はi番目の列車のDepartureを作る
+#バイナリ時刻表のminutesはファイルを直接参照するmemoryviewで、Departureは返す分だけ作る
+class Schedule(NamedTuple):
+    minutes: Sequence[int]
+    departure: Callable[[int], Departure]
+
+    #after_minute以降に発車する列車をn本返す
+    def next_departures(self, after_minute, n=3):
+        i = bisect_left(self.minutes, after_minute)
+        return [self.departure(j) for j in range(i, min(i + n, len(self.minutes)))]
+
+TRAIN_MASTER_PATH = "data/train_data/train_master.csv"
+COMPILED_TIMETABLE_PATH = "data/train_data/timetable.bin"
+MINUTES_PER_DAY = 24 * 60
+
+#個人設定の読み込み(プロセス内で1回だけ、.envを変えたらreload_settings()を呼ぶ)
+@lru_cache(maxsize=None)
 def load_settings():
     load_dotenv()
     return PersonalConfig(
@@ -41,90 +81,246 @@ def load_settings():
         DASH_TIME_MIN = int(os.getenv("DASH_TIME_MIN"))
     )
 
+#個人設定の読み直し
+def reload_settings():
+    load_settings.cache_clear()
+    return load_settings()
+
+#休日または祝日ならTrue、平日かつ祝日でないならFalseを返す(運行日カレンダーを引くだけ)
+def is_weekend_holiday(day: date):
+    return get_service_calendar(day).schedule_id(day) != WEEKDAY
+
 # 現在の時刻(datetime型)、日付(str型)、時刻(str型)、
-# 休日か平日かの判定(bool型)(休日ならTrue平日ならFalse)、対応する時刻表の相対パス(str型)
-def get_time():
-   now = datetime.now()
+# 休日か平日かの判定(bool型)(休日ならTrue平日ならFalse)、対応する時刻表の相対パス(str型)、
+# ダイヤ種別(str型)(weekday, weekend, 時刻表があればsaturdayや上書きファイルで指定した種別)
+def get_time(now=None):
+   if now is None:
+       now = datetime.now()
    today = now.date()
    display_day = today.strftime("%m/%d")
    display_time = now.time().strftime("%H:%M:%S")
-   #曜日を返す(0:月, 1:火, 2:水, 3:木, 4:金, 5:土, 6:日)
-   week = now.weekday()
-   
-   #休日または祝日ならTrue、平日かつ祝日でないならFalseを返す
-   weekend = week >= 5
-   japanese_holiday = jpholiday.is_holiday(today)
-   weekend_holiday = weekend or japanese_holiday
-   
-   if weekend_holiday:
-       today_csv = "data/train_data/schedule_weekend.csv"
-   else:
-       today_csv = "data/train_data/schedule_weekday.csv"
+
+   #日付ごとのダイヤ種別は運行日カレンダーに計算済み
+   calendar = get_service_calendar(today)
+   schedule_id = calendar.schedule_id(today)
+   weekend_holiday = schedule_id != WEEKDAY
+   today_csv = calendar.csv_path(schedule_id)
 
    return NowTime(
        nowtime = now,
        day = display_day,
        time = display_time,
        weekend_holiday = weekend_holiday,
-       today_csv = today_csv
+       today_csv = today_csv,
+       schedule_id = schedule_id
    )
 
 #駅到達時刻の計算
-def arival_time():
-    walk_arival = get_time().nowtime + timedelta(minutes = load_settings().WALK_TIME_MIN)
-    dash_arival = get_time().nowtime + timedelta(minutes = load_settings().DASH_TIME_MIN)
+#徒歩とダッシュは同じ現在時刻から計算する
+def arival_time(now=None, settings=None):
+    if now is None:
+        now = datetime.now()
+    if settings is None:
+        settings = load_settings()
+    walk_arival = now + timedelta(minutes = settings.WALK_TIME_MIN)
+    dash_arival = now + timedelta(minutes = settings.DASH_TIME_MIN)
     return ArivalTime(
         walk_arival = walk_arival,
         dash_arival = dash_arival
     )
 
+#更新1回分の状況を作る(時計を読むのはここだけ)
+def train_context(now=None):
+    nowtime = get_time(now)
+    settings = load_settings()
+    return TrainContext(
+        now = nowtime,
+        settings = settings,
+        arival = arival_time(nowtime.nowtime, settings)
+    )
+
+#時刻表の索引
+#列車マスタと時刻表を一度だけ読み込み、発車時刻(0時からの分)の昇順配列を二分探索する
+#ファイルの更新時刻(mtime)が変わったときだけ読み直す
+#(python app/timetable_bin.py で作ったバイナリ時刻表があればCSVの代わりに使う)
+class TimetableIndex:
+    def __init__(self, master_path=TRAIN_MASTER_PATH, compiled_path=COMPILED_TIMETABLE_PATH):
+        self.master_path = master_path
+        self.compiled_path = compiled_path
+        self._master = {}
+        self._master_mtime = None
+        self._compiled = None
+        self._schedules = {}
+        self._lock = threading.RLock()
+
+    #列車マスタ(id -> 行)を返す
+    def master(self):
+        with self._lock:
+            return self._load_master()
+
+    def _load_master(self):
+        mtime = os.stat(self.master_path).st_mtime_ns
+        if mtime != self._master_mtime:
+            master = {}
+            with open(self.master_path, 'r', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    master[row['id']] = row
+            self._master = master
+            self._master_mtime = mtime
+        return self._master
+
+    #バイナリ時刻表(timetable.bin)があれば読み込む(更新されたら読み直す)
+    def _load_compiled(self):
+        try:
+            mtime = os.stat(self.compiled_path).st_mtime_ns
+        except FileNotFoundError:
+            self._drop_compiled()
+            return None
+        if self._compiled is None or self._compiled.mtime != mtime:
+            self._drop_compiled()
+            try:
+                self._compiled = CompiledTimetable(self.compiled_path)
+            except ValueError as e:
+                print(f"バイナリ時刻表を使えないためCSVを読み込みます: {e}")
+        return self._compiled
+
+    #読み込んだバイナリ時刻表と、それを参照している時刻表を捨ててメモリマップを閉じる
+    def _drop_compiled(self):
+        if self._compiled is None:
+            return
+        self._schedules = {path: cached for path, cached in self._schedules.items() if cached[0][0] != 'bin'}
+        self._compiled.close()
+        self._compiled = None
+
+    #時刻表(Schedule)を返す
+    #バイナリ時刻表がCSVより新しければそちらを使い、CSVの解析とマスタの結合を省く
+    #(返した時刻表はバイナリ時刻表を読み直すまで使える)
+    def schedule(self, csv_path):
+        with self._lock:
+            mtime = os.stat(csv_path).st_mtime_ns
+            master_mtime = os.stat(self.master_path).st_mtime_ns
+            compiled = self._load_compiled()
+            name = os.path.basename(csv_path)
+            if compiled and compiled.has(name) and compiled.mtime >= max(mtime, master_mtime):
+                source = ('bin', compiled.mtime)
+            else:
+                compiled = None
+                source = ('csv', mtime, master_mtime)
+
+            cached = self._schedules.get(csv_path)
+            #時刻表かマスタが更新されていれば作り直す
+            if cached and cached[0] == source:
+                return cached[1]
+
+            if compiled:
+                schedule = self._from_compiled(compiled, name)
+            else:
+                schedule = self._from_csv(csv_path)
+            self._schedules[csv_path] = (source, schedule)
+            return schedule
+
+    #発車時刻とマスタ番号の配列はメモリマップをそのまま使い、Departureは必要になったときに作る
+    def _from_compiled(self, compiled, name):
+        minutes, master_index = compiled.schedule(name)
+        master = compiled.master
+
+        def departure(i):
+            train_type, train_destination, train_color = master[master_index[i]]
+            return Departure(
+                minute = minutes[i],
+                train_type = train_type,
+                train_destination = train_destination,
+                train_color = train_color
+            )
+        return Schedule(minutes, departure)
+
+    def _from_csv(self, csv_path):
+        master = self._load_master()
+        departures = []
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                m_info = master.get(row['master_id'])
+                if not m_info:
+                    continue
+                departures.append(Departure(
+                    minute = int(row['hour']) * 60 + int(row['min']),
+                    train_type = m_info['type'],
+                    train_destination = m_info['dest'],
+                    train_color = m_info['color']
+                ))
+        departures.sort(key=lambda d: d.minute)
+        minutes = [d.minute for d in departures]
+        return Schedule(minutes, departures.__getitem__)
+
+    #after_minute(0時からの分)以降に発車する列車をn本返す
+    def next_departures(self, csv_path, after_minute, n=3):
+        with self._lock:
+            return self.schedule(csv_path).next_departures(after_minute, n)
+
+    #dayの0時を基準にした、前日・当日・翌日の運行日をつないだ連続の時刻表で
+    #after_minute(dayの0時からの分)以降に発車する列車をn本返す
+    #各運行日の時刻表を二分探索してn本ずつ候補を取り、早い順にn本選ぶ
+    #(前日分は24時以降の列車だけが対象。分はdayの0時からに直し、schedule_idを付ける)
+    def next_in_timeline(self, day, calendar, after_minute, n=3):
+        with self._lock:
+            candidates = []
+            for offset in (-1, 0, 1):
+                service_day = day + timedelta(days=offset)
+                schedule_id = calendar.schedule_id(service_day)
+                schedule = self.schedule(calendar.csv_path(schedule_id))
+                shift = offset * MINUTES_PER_DAY
+                for dep in schedule.next_departures(max(after_minute, 0) - shift, n):
+                    candidates.append(dep._replace(minute=dep.minute + shift, schedule_id=schedule_id))
+            #同じ分なら前日・当日・翌日の順(安定ソート)
+            candidates.sort(key=lambda d: d.minute)
+            return candidates[:n]
+
+_timetable_index = None
+
+#プロセス内で共有する時刻表の索引
+def get_timetable_index():
+    global _timetable_index
+    if _timetable_index is None:
+        _timetable_index = TimetableIndex()
+    return _timetable_index
+
 #列車基本情報の取得
 def train_base_info():
-    master = {}
-    train_master_path = "data/train_data/train_master.csv"
-    with open(train_master_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            master[row['id']] = row
-    return master
+    return dict(get_timetable_index().master())
 
 # 乗車可能列車情報の取得
-def upcoming_train():
-    nowtime = get_time()
-    arivaltime = arival_time()
-    master = train_base_info()
+def upcoming_train(context=None):
+    with metrics.stage("upcoming_train"):
+        return _upcoming_train(context)
+
+def _upcoming_train(context):
+    if context is None:
+        context = train_context()
+    nowtime = context.now
+    arivaltime = context.arival
+    midnight = nowtime.nowtime.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = midnight.date()
+
+    #ダッシュ到着時刻より前の列車は除外(発車時刻は0秒ちょうどなので分に切り上げる)
+    dash_minute = math.ceil((arivaltime.dash_arival - midnight).total_seconds() / 60)
+    #前日の深夜便・当日・翌日の始発をつないだ時刻表(0時からの分で、日付をまたいでも連続)から3本
+    departures = get_timetable_index().next_in_timeline(today, get_service_calendar(today), dash_minute, 3)
     upcoming = []
-    
-    with open(nowtime.today_csv, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            dep_dt = nowtime.nowtime.replace(
-                hour = int(row['hour']), 
-                minute = int(row['min']),
-                second = 0,
-                microsecond = 0
+    for dep in departures:
+        dep_dt = midnight + timedelta(minutes = dep.minute)
+        upcoming.append(
+            TrainInfo(
+                train_time = dep_dt.strftime('%H:%M'),
+                train_type = dep.train_type,
+                train_destination = dep.train_destination,
+                train_color = dep.train_color,
+                success_walk = dep_dt >= arivaltime.walk_arival,
+                success_dash = dep_dt >= arivaltime.dash_arival,
+                departure = dep_dt
             )
-            #ダッシュ到着時刻より前の列車は除外
-            if dep_dt < arivaltime.dash_arival:
-                continue
-            
-            m_info = master.get(row['master_id'])
-            if not m_info:
-                continue
-            
-            upcoming.append(
-                TrainInfo(
-                    train_time = dep_dt.strftime('%H:%M'),
-                    train_type = m_info['type'],
-                    train_destination = m_info['dest'],
-                    train_color = m_info['color'],
-                    success_walk = dep_dt >= arivaltime.walk_arival,
-                    success_dash = dep_dt >= arivaltime.dash_arival
-                )
-            )
-            if len(upcoming) >= 3:
-                break
-
+        )
 
     return upcoming
 
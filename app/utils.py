@@ -0,0 +1,251 @@
+import atexit
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import NamedTuple
+import requests
+from dotenv import load_dotenv
+import metrics
+
+#気象庁サーバーのURL(.envのJMA_BASE_URLで上書き可能。ベンチマークでは手元の代役サーバーを指す)
+DEFAULT_JMA_BASE_URL = "https://www.jma.go.jp"
+
+#通信設定の既定値(.envのJMA_MAX_WORKERS, JMA_REQUESTS_PER_SECで上書き可能)
+DEFAULT_MAX_WORKERS = 6
+DEFAULT_REQUESTS_PER_SEC = 8.0
+
+#1回の通信の待ち時間(秒)。(.envのJMA_CONNECT_TIMEOUT, JMA_READ_TIMEOUTで上書き可能)
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+#失敗したときの再試行(.envのJMA_MAX_RETRIES, JMA_RETRY_BACKOFFで上書き可能)
+#待ち時間は0〜backoff×2^回数の乱数(上限RETRY_BACKOFF_MAX)にして、複数の画面・スレッドが同時に再送しないようにする
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8.0
+#再試行するHTTPステータス(混雑・一時的なサーバーエラー)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+#古いデータがあるとき、取り直しの完了を待つ時間(.envのJMA_STALE_WAIT_SECで上書き可能)
+DEFAULT_STALE_WAIT = 1.0
+
+
+#1秒あたりのリクエスト数を制限するレートリミッタ(トークンバケット方式)
+#複数スレッドから同時に呼ばれても全体のリクエスト数が上限を超えないようにする
+class RateLimiter:
+    def __init__(self, rate_per_sec: float, burst: int = None):
+        self.rate = float(rate_per_sec)
+        #一度に連続して送れる最大数(未指定なら1秒分)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        #レート0以下なら制限しない
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+#.envから読み込んだ通信設定(プロセス内で1回だけ読む)
+class HttpSettings(NamedTuple):
+    max_workers: int
+    connect_timeout: float
+    read_timeout: float
+    max_retries: int
+    retry_backoff: float
+    stale_wait: float
+
+
+_session = None
+_limiter = None
+_settings = None
+_lock = threading.Lock()
+
+
+#.envから通信設定を読み込む
+def _env_number(key, default, cast):
+    load_dotenv()
+    value = os.getenv(key)
+    if value in (None, ""):
+        return default
+    return cast(value)
+
+
+#通信設定(最初に呼ばれたときに.envを読む)
+def get_http_settings() -> HttpSettings:
+    global _settings
+    with _lock:
+        if _settings is None:
+            _settings = HttpSettings(
+                max_workers = _env_number("JMA_MAX_WORKERS", DEFAULT_MAX_WORKERS, int),
+                connect_timeout = _env_number("JMA_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT, float),
+                read_timeout = _env_number("JMA_READ_TIMEOUT", DEFAULT_READ_TIMEOUT, float),
+                max_retries = _env_number("JMA_MAX_RETRIES", DEFAULT_MAX_RETRIES, int),
+                retry_backoff = _env_number("JMA_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF, float),
+                stale_wait = _env_number("JMA_STALE_WAIT_SEC", DEFAULT_STALE_WAIT, float)
+            )
+        return _settings
+
+
+#keep-aliveで接続を使い回す共有セッション
+def get_session() -> requests.Session:
+    global _session
+    workers = get_http_settings().max_workers
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            #並列数と同じだけ接続をプールしておく
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+#気象庁サーバー向けの共有レートリミッタ(apiのお作法)
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            rate = _env_number("JMA_REQUESTS_PER_SEC", DEFAULT_REQUESTS_PER_SEC, float)
+            _limiter = RateLimiter(rate)
+        return _limiter
+
+
+#気象庁サーバーのURL(最初に呼ばれたときに.envを読む。読み直すときはcache_clear()を呼ぶ)
+@lru_cache(maxsize=None)
+def jma_base_url() -> str:
+    load_dotenv()
+    return (os.getenv("JMA_BASE_URL") or DEFAULT_JMA_BASE_URL).rstrip("/")
+
+
+#気象庁サーバーのパスからURLを作る
+def jma_url(path: str) -> str:
+    return jma_base_url() + path
+
+
+#再試行までの待ち時間(Retry-Afterがあればそれに従う)
+def _retry_delay(attempt: int, backoff: float, response=None) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_BACKOFF_MAX)
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, backoff * (2 ** attempt)))
+
+
+#レート制限・タイムアウト・再試行付きでGETする
+#接続できない・応答が無い・一時的なエラー(RETRY_STATUS)のときだけ再試行し、
+#それでも失敗したら最後の例外を投げる(HTTPエラーは応答をそのまま返すのでraise_for_statusで扱う)
+def polite_get(url, **kwargs) -> requests.Response:
+    settings = get_http_settings()
+    kwargs.setdefault("timeout", (settings.connect_timeout, settings.read_timeout))
+    max_retries = settings.max_retries
+    backoff = settings.retry_backoff
+
+    for attempt in range(max_retries + 1):
+        get_rate_limiter().acquire()
+        try:
+            with metrics.stage("http_get"):
+                response = get_session().get(url, **kwargs)
+            metrics.add_bytes("http_get", len(response.content))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            print(f"通信に失敗したため再試行します({attempt + 1}/{max_retries}): {e}")
+            time.sleep(_retry_delay(attempt, backoff))
+            continue
+        if response.status_code not in RETRY_STATUS or attempt == max_retries:
+            return response
+        metrics.count_error("http_get")
+        print(f"{response.status_code}が返ったため再試行します({attempt + 1}/{max_retries}): {url}")
+        time.sleep(_retry_delay(attempt, backoff, response))
+
+
+#最後に取得できた値を覚えておき、古くなったら取り直すキャッシュ(stale-while-revalidate)
+#  新しい値があればそれを返す
+#  古い値しか無ければ取り直しを始め、waitの秒数だけ待って間に合わなければ古い値を返す
+#  (取り直しは裏で続き、終われば次から新しい値を返す)
+#  取り直しに失敗したら古い値を返す。値が1つも無いときだけ取得を待ち、失敗すれば例外を投げる
+#同じキーの取り直しは同時に1つしか動かさない
+#取り直し用のスレッドはプロセスの終了時(またはclose())に止める
+class StaleWhileRevalidate:
+    def __init__(self, wait: float = None, max_workers: int = 2):
+        if wait is None:
+            wait = get_http_settings().stale_wait
+        self.wait = wait
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="revalidate")
+        atexit.register(self.close)
+
+    #保存している値(無ければNone)
+    def peek(self, key):
+        with self._lock:
+            return self._values.get(key)
+
+    #fetch(前回の値またはNone)で新しい値を取得する。is_fresh(値)がTrueなら取り直さない
+    def get(self, key, fetch, is_fresh):
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None and is_fresh(value):
+                return value
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._revalidate, key, fetch, value)
+                self._pending[key] = future
+
+        try:
+            return future.result(timeout=None if value is None else self.wait)
+        except FutureTimeoutError:
+            return value
+        except Exception:
+            if value is None:
+                raise
+            return value
+
+    def _revalidate(self, key, fetch, previous):
+        try:
+            value = fetch(previous)
+            with self._lock:
+                self._values[key] = value
+            return value
+        except Exception as e:
+            if previous is not None:
+                print(f"取得に失敗したため前回のデータを使います: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    #取り直しのスレッドを止める(待っている取り直しは取り消す)
+    def close(self):
+        atexit.unregister(self.close)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+#funcを並列に実行し、itemsと同じ順番で結果を返す
+def fetch_all(func, items, max_workers: int = None):
+    items = list(items)
+    if not items:
+        return []
+    if max_workers is None:
+        max_workers = get_http_settings().max_workers
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
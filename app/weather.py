@@ -1,12 +1,14 @@
 import math
-import requests
+import json
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 from typing import NamedTuple, List
-import time
-from scipy.interpolate import Akima1DInterpolator, PchipInterpolator
-import numpy as np
+from functools import lru_cache
+from utils import StaleWhileRevalidate, jma_url, polite_get, fetch_all
+from amedas_store import get_snapshot_store
+from forecast_client import get_forecast_client
+import metrics
 
 #クラスの定義
 class WeatherPoint(NamedTuple):
@@ -35,18 +37,34 @@ class UmbrellaResult(NamedTuple):
     level_12h: int    # 0:なし, 1:折り畳み, 2:必須
     max_pop_12h: float 
 
-#予報数値の取得
-def get_weather_forcast():
+class ForecastSettings(NamedTuple):
+    location_name: str
+    meso_area_code: str
+    local_area_code: str
+    city_code: str
+
+#予報地点の設定の読み込み(プロセス内で1回だけ、読み直すときはcache_clear()を呼ぶ)
+@lru_cache(maxsize=None)
+def load_forecast_settings():
     load_dotenv()
-    location = os.getenv("LOCATION_NAME")
-    meso_area_code = os.getenv("MESO_AREA_CODE")
-    local_area_code = os.getenv("LOCAL_AREA_CODE")
-    city_code = os.getenv("CITY_CODE")
-    url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{meso_area_code}.json"
-    
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
+    return ForecastSettings(
+        location_name = os.getenv("LOCATION_NAME"),
+        meso_area_code = os.getenv("MESO_AREA_CODE"),
+        local_area_code = os.getenv("LOCAL_AREA_CODE"),
+        city_code = os.getenv("CITY_CODE")
+    )
+
+#予報数値の取得
+#予報JSONは次の発表までキャッシュされるので、何度呼んでも通信は発表ごとに1回だけ
+#settingsを省略すると.envの地点を使う
+def get_weather_forcast(settings: ForecastSettings = None):
+    if settings is None:
+        settings = load_forecast_settings()
+    location = settings.location_name
+    local_area_code = settings.local_area_code
+    city_code = settings.city_code
+
+    data = get_forecast_client().get(settings.meso_area_code)
     #今日、明日、明後日のデータは最初のカラムに入っている
     raw_data = data[0]
     weather_list = []
@@ -85,25 +103,42 @@ def get_weather_forcast():
         temps=temp_list
     )
 
-#予報数値を将来12時間分の内挿
-def interpolate_forecast(forecasts_point, mode:str):
+#観測データから最新の1件と、そこから1時間以上ずつさかのぼったデータをcount件選ぶ(古い順)
+def recent_hourly_observations(observations, count: int = 3):
+    selected = []
+    for obs in sorted(observations, key=lambda x: x.time, reverse=True):
+        if not selected or selected[-1].time - obs.time >= timedelta(minutes=50):
+            selected.append(obs)
+        if len(selected) >= count:
+            break
+    return list(reversed(selected))
+
+#予報の補間曲線の作成
+#気温(temps)では取得済みのアメダス観測データ(observations)を起点にする。通信は行わない
+#節点が前回と同じならフィット済みの曲線をそのまま返す
+def forecast_curve(forecasts_point, mode:str, observations=None):
     #データが2つ未満なら補完せずに返す
     if len(forecasts_point) < 2:
         print("補間に十分なデータ数がありません")
         return None
 
     data = []
+    origin = None
     if mode == "temps":
-        amedas_data = collect_12th_amedas()
-        amedas_3h_data = sorted(amedas_data[:3], key=lambda x: x.time)
+        if not observations:
+            print("気温の補間にはアメダスの観測データが必要です")
+            return None
+        amedas_3h_data = recent_hourly_observations(observations, 3)
         for h in amedas_3h_data:
             data.append(WeatherPoint(time=h.time, value=h.temp))
 
         #アメダスの3時間前データよりも未来の予報データのみdataリストにいれる
-        latest_amedas_time = amedas_3h_data[2].time
+        latest_amedas_time = amedas_3h_data[-1].time
         for p in forecasts_point:
             if p.time > latest_amedas_time:
                 data.append(p)
+        #補間は最新のアメダスデータの時刻から始める
+        origin = latest_amedas_time.timestamp()
 
     elif mode == "pops":
         data = forecasts_point
@@ -111,55 +146,30 @@ def interpolate_forecast(forecasts_point, mode:str):
     else:
         print("選択したmodeが不正です。tempsかpopsと入力してください") 
         return None
-    
-    #datetime型からfloot型に一時的に変換
+
+    #datetime型からfloat型に変換
     x = [d.time.timestamp() for d in data]
     y = [d.value for d in data]
 
-    #補間方法
-    #気温なら秋間補間、降水確率はPCHIP補間、それ以外は補間せずに返す
-    if mode == "temps":
-        interp_func = Akima1DInterpolator(x, y)
+    #scipyは補間するときに初めて読み込む
+    from forecast_curve import fit_curve
+    return fit_curve(x, y, mode, origin)
 
-    elif mode == "pops":
-        interp_func = PchipInterpolator(x, y)
-    
-    else:
-        print("選択したmodeが不正です") 
-        return None
-
-    #期間の設定
-    start_time = x[0]
-    end_time = x[-1]
-    forcast_start_time = sorted(forecasts_point, key=lambda x: x.time)[0]
-
-    x_new = np.arange(start_time, end_time + 1, 3600)
-    y_new = interp_func(x_new)
+#予報数値を将来12時間分の内挿
+#(配列のまま扱うときはforecast_curve(...).evaluate()を使う)
+def interpolate_forecast(forecasts_point, mode:str, observations=None):
+    with metrics.stage(f"interpolate_{mode}"):
+        curve = forecast_curve(forecasts_point, mode, observations)
+        if curve is None:
+            return None
+        x_new, y_new = curve.evaluate()
 
-    result = []
     # タイムゾーン情報を保持するために、入力データのtzinfoを使う
-    tz = data[0].time.tzinfo
-    
-    for ts, val in zip(x_new, y_new):
-        if mode == "temps":
-            current_dt = datetime.fromtimestamp(ts, tz=tz)
-            #補間したリストを最新のアメダスデータよりも新しいもののみをリストに残す
-            if latest_amedas_time and current_dt < latest_amedas_time:
-                continue
-
-        if mode in ['pop', 'humidity']:
-            val = max(0.0, min(100.0, val))
-            
-        result.append(WeatherPoint(
-            time=datetime.fromtimestamp(ts, tz=tz), # 数値を日付に戻す
-            value=round(float(val), 1)
-        ))
-    
-    return result
-
-
-
-
+    tz = forecasts_point[0].time.tzinfo
+    return [
+        WeatherPoint(time=datetime.fromtimestamp(ts, tz=tz), value=val)
+        for ts, val in zip(x_new.tolist(), y_new.tolist())
+    ]
 
 
 #アメダスデータ取得用欠損地ヘルパー関数    
@@ -173,56 +183,174 @@ def get_safe_value(data_dict, key, default=None):
     return default
 
 
+LATEST_TIME_PATH = "/bosai/amedas/data/latest_time.txt"
+AMEDAS_MAP_PATH = "/bosai/amedas/data/map/{time}.json"
+#アメダスは10分ごとに更新される。latest_time.txtの時刻から間隔+公開の遅れ(.envのAMEDAS_LAG_SEC)までは
+#次の時刻は出ていないので問い合わせない
+AMEDAS_INTERVAL = timedelta(minutes=10)
+DEFAULT_AMEDAS_LAG_SEC = 90
+_latest_time_cache = None
+
+
+@lru_cache(maxsize=None)
+def amedas_lag() -> timedelta:
+    load_dotenv()
+    return timedelta(seconds=float(os.getenv("AMEDAS_LAG_SEC") or DEFAULT_AMEDAS_LAG_SEC))
+
+
+def _latest_time_fresh(latest: datetime) -> bool:
+    return datetime.now().astimezone() < latest + AMEDAS_INTERVAL + amedas_lag()
+
+
+def _fetch_latest_time(previous=None):
+    response = polite_get(jma_url(LATEST_TIME_PATH))
+    response.raise_for_status()
+    raw_str = response.text.strip()
+    #datetime型に変換
+    return datetime.strptime(raw_str, '%Y-%m-%dT%H:%M:%S%z')
+
+
 #最新のアメダスデータの時刻取得(datetime.datetime型で出力)
+#次の観測が公開されるまでは前回の時刻を返し、それ以降は問い合わせる
+#(応答が遅い・失敗したときは前回取得できた時刻を返す)
 def amedas_now_time():
-    url = "https://www.jma.go.jp/bosai/amedas/data/latest_time.txt"
+    global _latest_time_cache
+    if _latest_time_cache is None:
+        _latest_time_cache = StaleWhileRevalidate()
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        raw_str = response.text.strip()
-        #datetime型に変換
-        dt = datetime.strptime(raw_str, '%Y-%m-%dT%H:%M:%S%z')
-        return dt
-
+        with metrics.stage("amedas_latest_time"):
+            return _latest_time_cache.get("latest_time", _fetch_latest_time, _latest_time_fresh)
     except Exception as e:
         print(f"最新時刻の取得に失敗: {e}")
         return None
 
 
-#アメダスのデータ取得
-def get_amedas_data(found_time:datetime):
-    load_dotenv()
-    amedas_number = os.getenv("AMEDAS_NUMBER")
+#アメダス全国スナップショット(JSONのバイト列)の取得
+#公開済みのスナップショットは変わらないので、保存済みならダウンロードしない
+def fetch_amedas_map(found_time:datetime) -> bytes:
+    store = get_snapshot_store()
+    raw = store.get(found_time)
+    if raw is not None:
+        metrics.cache_hit("amedas_map")
+        return raw
+    metrics.cache_miss("amedas_map")
+
     url_time = found_time.strftime("%Y%m%d%H%M00")
-    url = f"https://www.jma.go.jp/bosai/amedas/data/map/{url_time}.json"
-    
-    try:
-        response = requests.get(url)
+    url = jma_url(AMEDAS_MAP_PATH.format(time=url_time))
+    with metrics.stage("amedas_map"):
+        response = polite_get(url)
         response.raise_for_status()
-        data = response.json()
+        raw = response.content
+        store.put(found_time, raw)
+    metrics.add_bytes("amedas_map", len(raw))
+    return raw
+
+#posより前にある空白以外の1バイトを返す
+def _prev_byte(raw: bytes, pos: int) -> bytes:
+    i = pos - 1
+    while i >= 0 and raw[i:i + 1].isspace():
+        i -= 1
+    return raw[i:i + 1]
+
+
+#全国スナップショットから指定地点のオブジェクトだけを取り出す
+#約1300地点ぶんの辞書を作らず、地点番号のキーを探してその地点だけをデコードする
+def extract_stations(raw: bytes, amedas_numbers) -> dict:
+    result = {}
+    for number in amedas_numbers:
+        key = f'"{number}"'.encode()
+        pos = raw.find(key)
+        #トップレベルのキー(直前が { か ,)になるまで探す
+        while pos != -1 and _prev_byte(raw, pos) not in (b"{", b","):
+            pos = raw.find(key, pos + len(key))
+        if pos == -1:
+            continue
 
-        select_data = data.get(amedas_number)
-        temp = get_safe_value(select_data, "temp")
-        humidity = get_safe_value(select_data, "humidity")
-        precipitation1h = get_safe_value(select_data, "precipitation1h")
-        wind_direction = get_safe_value(select_data, "windDirection")
-        wind = get_safe_value(select_data, "wind")
+        colon = pos + len(key)
+        while raw[colon:colon + 1].isspace():
+            colon += 1
+        if raw[colon:colon + 1] != b":":
+            raise ValueError(f"地点{number}のキーの形式が不正です")
+        start = raw.find(b"{", colon)
+        #地点のオブジェクトは配列のみを含むので、最初の } で閉じる
+        end = raw.find(b"}", start)
+        if start == -1 or end == -1:
+            raise ValueError(f"地点{number}のデータが途中で切れています")
+        result[number] = json.loads(raw[start:end + 1])
+    return result
 
-        if None in [temp, humidity, wind_direction, wind]:
-            return None
 
-        return Amedas_data(
-            time = found_time,
-            temp = temp,
-            humidity = humidity,
-            precipitation1h = precipitation1h,
-            wind_direction = wind_direction,
-            wind = wind
-        )
-    
+#全国スナップショットを解析して指定地点の辞書を返す
+#mode="filtered"は指定地点だけを取り出し、"full"は全体をデコードする(.envのAMEDAS_PARSE_MODEで切替)
+def parse_amedas_map(raw: bytes, amedas_numbers, mode: str = None) -> dict:
+    if mode is None:
+        mode = os.getenv("AMEDAS_PARSE_MODE") or "filtered"
+    with metrics.stage("amedas_parse"):
+        return _parse_amedas_map(raw, amedas_numbers, mode)
+
+
+def _parse_amedas_map(raw: bytes, amedas_numbers, mode: str) -> dict:
+
+    if mode == "filtered":
+        try:
+            return extract_stations(raw, amedas_numbers)
+        except ValueError as e:
+            #想定外の形式なら全体のデコードに切り替える
+            print(f"地点の抽出に失敗したため全体を解析します: {e}")
+
+    data = json.loads(raw)
+    return {number: data[number] for number in amedas_numbers if number in data}
+
+
+#地点のデータ辞書をAmedas_dataに変換する(欠測があればNone)
+def to_amedas_data(found_time: datetime, select_data):
+    if not select_data:
+        return None
+
+    temp = get_safe_value(select_data, "temp")
+    humidity = get_safe_value(select_data, "humidity")
+    precipitation1h = get_safe_value(select_data, "precipitation1h")
+    wind_direction = get_safe_value(select_data, "windDirection")
+    wind = get_safe_value(select_data, "wind")
+
+    if None in [temp, humidity, wind_direction, wind]:
+        return None
+
+    return Amedas_data(
+        time = found_time,
+        temp = temp,
+        humidity = humidity,
+        precipitation1h = precipitation1h,
+        wind_direction = wind_direction,
+        wind = wind
+    )
+
+
+#.envに設定された地点番号
+def default_amedas_number() -> str:
+    load_dotenv()
+    return os.getenv("AMEDAS_NUMBER")
+
+
+#複数地点のアメダスデータ取得
+#1時刻につきダウンロードと解析は1回だけ行い、{地点番号: Amedas_data}を返す(欠測の地点はNone)
+def get_amedas_data_multi(found_time:datetime, amedas_numbers) -> dict:
+    amedas_numbers = list(amedas_numbers)
+    url_time = found_time.strftime("%Y%m%d%H%M00")
+
+    try:
+        stations = parse_amedas_map(fetch_amedas_map(found_time), amedas_numbers)
     except Exception as e:
         print(f"({url_time})に対応するURLが存在しません: {e}")
-        return None
+        return {number: None for number in amedas_numbers}
+
+    return {number: to_amedas_data(found_time, stations.get(number)) for number in amedas_numbers}
+
+
+#アメダスのデータ取得
+def get_amedas_data(found_time:datetime):
+    amedas_number = default_amedas_number()
+    return get_amedas_data_multi(found_time, [amedas_number])[amedas_number]
 
 #アメダスの過去12時間分のデータ取得
 def collect_12th_amedas():
@@ -231,50 +359,49 @@ def collect_12th_amedas():
         print("最新情報の時刻データを取得できません")
         return []
 
-    amedas_list = []
-
-    for i in range(12):
-        target_time = base_time - timedelta(hours=i)
-        data = get_amedas_data(target_time)
-        #Noneでなければデータに追加
-        if data:
-            amedas_list.append(data)
-        #0.5秒処理を止める、apiのお作法
-        time.sleep(0.5)
+    target_times = [base_time - timedelta(hours=i) for i in range(12)]
+    #共有セッションで並列取得(リクエスト間隔はレートリミッタで制御)
+    results = fetch_all(get_amedas_data, target_times)
 
-    return amedas_list
+    #Noneでなければデータに追加
+    return [data for data in results if data]
 
 
 #アメダスの過去12時間分のデータ取得
-#現在の10分刻みの最新データ＋正時のデータ
-def collect_12th_amedas00():
-    base_time = amedas_now_time()
+#現在の10分刻みの最新データ＋正時のデータを新しい順に並べたリスト(先頭が最新)
+#amedas_numberを省略すると.envの地点
+#base_timeに取得済みの最新時刻を渡すとlatest_time.txtを取り直さない
+def collect_12th_amedas00(amedas_number=None, base_time=None):
+    if amedas_number is None:
+        amedas_number = default_amedas_number()
+    return collect_12th_amedas00_many([amedas_number], base_time)[amedas_number]
+
+
+#複数地点のアメダスの過去12時間分のデータ取得
+#{地点番号: collect_12th_amedas00と同じ形のリスト}を返す
+def collect_12th_amedas00_many(amedas_numbers, base_time=None) -> dict:
+    amedas_numbers = list(amedas_numbers)
+
+    if base_time is None:
+        base_time = amedas_now_time()
     if not base_time:
         print("最新情報の時刻データを取得できません")
-        return []
-
-    amedas_list = []
-
-    latest_data = get_amedas_data(base_time)
-    if latest_data:
-        amedas_list.append(latest_data)
+        return {number: [] for number in amedas_numbers}
 
     base_hour = base_time.replace(minute=0, second=0, microsecond=0)
+    hourly_times = [base_hour - timedelta(hours=i) for i in range(13)]
+    #現在時刻が正時のデータなら重複して取得しない
+    target_times = [base_time] + [t for t in hourly_times if t != base_time]
 
-    for i in range(13):
-        target_time = base_hour - timedelta(hours=i)
-        data = get_amedas_data(target_time)
-        #現在時刻が正時のデータなら重複して取得しない
-        if target_time == base_time:
-            continue
+    #共有セッションで並列取得(リクエスト間隔はレートリミッタで制御)
+    #全地点を1時刻1回のダウンロードでまとめて取り出す
+    results = fetch_all(lambda t: get_amedas_data_multi(t, amedas_numbers), target_times)
 
-        #Noneでなければデータに追加
-        if data:
-            amedas_list.append(data)
-        #0.5秒処理を止める、apiのお作法
-        time.sleep(0.5)
-
-    return amedas_list
+    #Noneでなければデータに追加
+    return {
+        number: [result[number] for result in results if result[number]]
+        for number in amedas_numbers
+    }
 
 """
 #アメダスと予報の気温データを合体
@@ -322,18 +449,24 @@ def apparent_temp(amedas):
     return round(at, 1)
 
 #アメダスデータに体感温度を付与する
+#(まとめて扱うときはobservation.build_observation_seriesの列データを使う)
 def list_apparent_temp(amedas_list):
-    apparent_temp_list = []
-    for amedas in amedas_list:
-     
-        at =  apparent_temp(amedas)       
+    #numpyは配列で計算するときに初めて読み込む
+    from observation import apparent_temp_array
 
-        apparent_temp_list.append({
+    ats = apparent_temp_array(
+        [amedas.temp for amedas in amedas_list],
+        [amedas.humidity for amedas in amedas_list],
+        [amedas.wind for amedas in amedas_list]
+    )
+    return [
+        {
             "time" : amedas.time,
             "real_temp": amedas.temp,
-            "apparent_temp": at
-        }) 
-    return apparent_temp_list
+            "apparent_temp": float(at)
+        }
+        for amedas, at in zip(amedas_list, ats)
+    ]
 
 # 補間済みの降水確率データから、6時間・12時間以内の傘必要度を判定する
 def judge_umbrella_necessity(fine_pops: List[WeatherPoint]) -> UmbrellaResult:
@@ -386,8 +519,8 @@ def get_weather_emoji(code):
 
 # --- 動作確認 ---
 if __name__ == "__main__":
-    url = "https://www.jma.go.jp/bosai/forecast/data/forecast/420000.json"
-    response = requests.get(url)
+    url = jma_url("/bosai/forecast/data/forecast/420000.json")
+    response = polite_get(url)
     response.raise_for_status()
     data = response.json()
     raw_data = data[0]
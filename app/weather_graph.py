@@ -1,10 +1,100 @@
+import io
+import os
 import weather as wt
-import matplotlib.pyplot as plt
-import japanize_matplotlib 
+from observation import build_observation_series
+import metrics
 from datetime import datetime,  timedelta
-import matplotlib.dates as mdates
+from functools import lru_cache
+from typing import NamedTuple
 import numpy as np
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+
+#ダッシュボード画像の出力先
+OUTPUT_PATH = 'img/weather_report.png'
+
+#表示範囲(現在時刻の前後)と、背景を描き直す時間軸の刻み
+WINDOW_HOURS = 12
+WINDOW_STEP = timedelta(minutes=10)
+
+#アイコンのディレクトリ(起動時にまとめて読み込める)
+ICON_DIRS = ["icons/weather/weather_code", "icons/weather/umb_func"]
+
+#読み込み・白色化済みのアイコン {(パス, 白色化): 画像配列 または 見つからなければNone}
+_icon_cache = {}
+
+#描画に使うライブラリ
+class Graphics(NamedTuple):
+    plt: object
+    mdates: object
+    Figure: type
+    FigureCanvasAgg: type
+    OffsetImage: type
+    AnnotationBbox: type
+    Image: object
+
+@lru_cache(maxsize=None)
+def graphics() -> Graphics:
+    """
+    matplotlib・日本語フォント・PILを読み込んで返す関数
+    import時ではなく最初の描画・アイコン読み込みのときに1回だけ読み込みます
+    """
+    import matplotlib.pyplot as plt
+    import japanize_matplotlib # 日本語フォントの設定
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+    from PIL import Image
+    return Graphics(plt, mdates, Figure, FigureCanvasAgg, OffsetImage, AnnotationBbox, Image)
+
+def load_icon(image_path, colorize_white=True):
+    """
+    アイコン画像を読み込む関数
+    colorize_white=True のとき、画像（黒いアイコンなど）を強制的に白くします
+    """
+    # 1. 画像を読み込む
+    img = graphics().plt.imread(image_path)
+
+    # 2. 画像の色を加工する (NumPyを使用)
+    if colorize_white:
+        # データのコピーを作成
+        img_processed = img.copy()
+        # RGBチャンネル (0, 1, 2番目) をすべて 1.0 (白) に書き換える
+        # アルファチャンネル (3番目: 透明度) はそのままにする
+        img_processed[:, :, :3] = 1.0
+        img = img_processed
+    return img
+
+def get_icon(image_path, colorize_white=True):
+    """
+    キャッシュ付きでアイコンを取得する関数
+    同じアイコンの読み込みと白色化はプロセス内で1回だけ行い、
+    見つからないアイコンはNoneを覚えておいて毎回ディスクを探さない
+    (zoomはOffsetImageが描画時に適用するのでキャッシュのキーには含めない)
+    """
+    key = (image_path, colorize_white)
+    if key not in _icon_cache:
+        try:
+            img = load_icon(image_path, colorize_white)
+            img.setflags(write=False) # 共有する配列なので書き換えを禁止
+        except FileNotFoundError:
+            print(f"Warning: Icon not found at {image_path}")
+            img = None
+        _icon_cache[key] = img
+    return _icon_cache[key]
+
+def preload_icons(dirs=None, colorize_white=True):
+    """
+    天気コード・傘判定のアイコンをまとめて読み込んでおく関数
+    常駐プロセスの起動時に呼ぶと、最初の描画でディスクを読まずに済みます
+    """
+    count = 0
+    for icon_dir in dirs or ICON_DIRS:
+        if not os.path.isdir(icon_dir):
+            continue
+        for name in sorted(os.listdir(icon_dir)):
+            if name.endswith('.png') and get_icon(os.path.join(icon_dir, name), colorize_white) is not None:
+                count += 1
+    return count
 
 def add_icon(fig, image_path, xy, zoom=0.1, colorize_white=True):
     """
@@ -12,206 +102,335 @@ def add_icon(fig, image_path, xy, zoom=0.1, colorize_white=True):
     colorize_white=True のとき、画像（黒いアイコンなど）を強制的に白くします
     """
     try:
-        # 1. 画像を読み込む
-        img = plt.imread(image_path)
-        
-        # 2. 画像の色を加工する (NumPyを使用)
-        if colorize_white:
-            # データのコピーを作成
-            img_processed = img.copy()
-            # RGBチャンネル (0, 1, 2番目) をすべて 1.0 (白) に書き換える
-            # アルファチャンネル (3番目: 透明度) はそのままにする
-            img_processed[:, :, :3] = 1.0
-            img = img_processed
+        gfx = graphics()
+        img = get_icon(image_path, colorize_white)
+        if img is None:
+            return
 
         # 3. 加工した画像を OffsetImage に渡す
         # ここに colorize_white を入れてはいけません（エラーの原因になります）
-        imagebox = OffsetImage(img, zoom=zoom)
+        imagebox = gfx.OffsetImage(img, zoom=zoom)
 
         # 4. 配置の設定
-        ab = AnnotationBbox(imagebox, xy, xycoords='figure fraction', 
-                            frameon=False, box_alignment=(0, 0.5))
-        
+        ab = gfx.AnnotationBbox(imagebox, xy, xycoords='figure fraction',
+                                frameon=False, box_alignment=(0, 0.5))
+
         # Figureに描画を追加
         fig.gca().add_artist(ab)
-        
-    except FileNotFoundError:
-        print(f"Warning: Icon not found at {image_path}")
+
     except Exception as e:
         print(f"Error loading icon {image_path}: {e}")
 
-def draw_weather_dashboard(past_data, intr_temps, intr_pops, forecast_info, umbrella):
-    # --- 1. スタイルの設定 (ダークモード) ---
-    plt.style.use('dark_background')
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(11, 9), sharex=True, gridspec_kw={'height_ratios': [3, 1.5, 0.3]})
-    plt.subplots_adjust(top=0.82, hspace=0.15) #上下の間隔をつめて一体感を出す
-
-    # データのタイムゾーンを取得と時間の設定
-    tz = past_data[0].time.tzinfo
-    now = datetime.now(tz=tz)
-    start_time = now - timedelta(hours=12)
-    end_time = now + timedelta(hours=12)
-
-    # アメダスのデータを古いデータを先頭に並べ替える
-    past_data = sorted(past_data[1:], key=lambda x: x.time)
-
-    latest = past_data[-1]
-    at_latest = wt.list_apparent_temp([latest])[0]["apparent_temp"]
-
-    # --- 1段目: 日付・時刻・天気アイコン ---
-    date_str = now.strftime('%m/%d')
-    time_str = now.strftime('%H:%M')
-    
-    # テキスト配置 (座標は 0.0〜1.0 の相対位置)
-    fig.text(0.21, 0.87, f"{date_str}  {time_str}", fontsize=24, color='white', fontweight='bold')
-    
-    # 天気アイコン ( weather_codes[0] からファイル名を判定 )
-    weather_icon_path = f"icons/weather/weather_code/{forecast_info.weather_codes[0]}.png"
-    add_icon(fig, weather_icon_path, xy=(0.39, 0.81), zoom=0.25, colorize_white=True) # 天気アイコン
-
-    # --- 2段目: 各種数値・傘アイコン ---
-    # 数値テキスト
-    metrics_text = (
-        f"気温: {latest.temp:.1f}℃   体感: {at_latest:.1f}℃   "
-        f"湿度: {latest.humidity}%   降水: {latest.precipitation1h}mm"
-    )
-    fig.text(0.12, 0.84, metrics_text, fontsize=14, color='#cccccc')
-
-    # 傘情報とアイコン
-    fig.text(0.69, 0.85, "傘判定:", fontsize=12, color='#cccccc')
-    
-    # 6h傘アイコン ( umbrella.level_6h からファイル名判定 )
-    umb6_path = f"icons/weather/umb_func/{umbrella.level_6h}.png"
-    add_icon(fig, umb6_path, xy=(0.69, 0.78), zoom=0.25, colorize_white=True)
-    fig.text(0.75, 0.89, "6時間", fontsize=12, color='#cccccc')
-    
-    # 12h傘アイコン
-    umb12_path = f"icons/weather/umb_func/{umbrella.level_12h}.png"
-    add_icon(fig, umb12_path, xy=(0.75, 0.78), zoom=0.25, colorize_white=True)
-    fig.text(0.81, 0.89, "12時間", fontsize=12, color='#cccccc')
-
-
-
-    # --- 2. 上段：気温グラフ (ax1) ---
-    # 実績データ (history[1:])
-    past_times = [p.time for p in past_data]
-    past_temps = [p.temp for p in past_data]
-    # 補間予報データ (fine_temps)
-    future_times = [f.time for f in intr_temps]
-    future_temps = [f.value for f in intr_temps]
-
-    ax1.plot(past_times, past_temps, color='#ff7f0e', linewidth=3, label='観測気温')
-    ax1.plot(future_times, future_temps, color='#ff7f0e', linestyle='--', linewidth=3, label='予報気温')
-    ax1.plot(past_times, [p["apparent_temp"] for p in wt.list_apparent_temp(past_data)], color='#ffbb78', linewidth=2, alpha=0.7, label='体感温度')
-
-    ax1.set_ylabel('気温 (℃)', color='#ff7f0e', fontsize=12)
-    ax1.tick_params(axis='y', labelcolor='#ff7f0e')
-
-    # 現在時刻に垂直線を引く
-    ax1.axvline(now, color='white', linestyle=':', alpha=0.5)
-    #ax1.text(now, ax1.get_ylim()[1], ' 現在', color='white', va='bottom', fontweight='bold')
-
-    ax1.set_ylim(-5, 35)
-    ax1.set_ylabel('気温 (℃)')
-    ax1.grid(True, alpha=0.5)
-    ax1.legend(loc='upper left', frameon=False)
-    #ax1.set_title(f"{forecast_info.location_name} のウェザーダッシュボード", fontsize=14, pad=20)
-
-    #降水確率　二軸グラフ
-    ax1_prec = ax1.twinx()
-
-    # 過去：アメダス降水量 (mm)
-    past_prec = [p.precipitation1h for p in past_data] # 降水量
-    bars_p = ax1_prec.bar(past_times, past_prec, color='#00ffff', alpha=0.5, width=0.03, label='降水量(mm/h)')
-    # 降水量の数値を棒の上に表示（0mmより大きい時のみ）
-    for bar in bars_p:
-        height = bar.get_height()
-        if height > 0:
-            ax1_prec.text(bar.get_x() + bar.get_width()/2., height + 1,
-                          f'{height}mm', ha='center', va='bottom', color='#00ffff', fontsize=8, fontweight='bold')
-
-    #降水確率
-    valid_pops = [p for p in intr_pops if p.time >= now]
-    pop_times = [p.time for p in valid_pops]
-    pop_vals = [p.value for p in valid_pops]
-    if pop_times:
-        # facecolor='none' で中身を空に、edgecolor で枠線を描画
-        ax1_prec.bar(pop_times, pop_vals, facecolor='none', edgecolor='#1f77b4', 
-                     linewidth=1.5, width=0.03, label='降水確率(%)', alpha=0.8)
-    
-    ax1_prec.set_ylim(0,100) # 降水量(100mm/h)と降水確率(100%)がこの軸の最大
-    ax1_prec.set_ylabel('降水量(mm/h) / 確率(%)', color='#1f77b4', fontsize=12)
-    ax1_prec.tick_params(axis='y', labelcolor='#1f77b4')
-    ax1_prec.grid(False) # 右軸のグリッドは非表示
-
-    #ax1.set_title(f"【{forecast_info.location_name}】 気象情報", fontsize=16, pad=20)
-    
-    # --- 3. サブグラフ (ax2)：体感温度 ＆ 風速 ---
-    # 実績データのみ（右半分は空く）
-    apparent_temps = wt.list_apparent_temp(past_data)
-    at_vals = [p["apparent_temp"] for p in apparent_temps]
-    wind_vals = [p.wind for p in past_data]
-    wind_dirs = [p.wind_direction for p in past_data]
-
-    #湿度(左軸)
-    hum_vals = [p.humidity for p in past_data] # アメダス湿度
-    ax2.plot(past_times, hum_vals, color='#5bc0de', linewidth=2, label='湿度')
-    ax2.set_ylabel('湿度 (%)', color='#5bc0de', fontsize=12)
-    ax2.tick_params(axis='y', labelcolor='#5bc0de')
-    ax2.set_ylim(0, 100)
-
-    # 風速 (右軸)
-    ax2_wind = ax2.twinx()
-    ax2_wind.plot(past_times, wind_vals, color='#2ca02c', linewidth=2, label='風速')
-    ax2_wind.set_ylabel('風速 [絶対値] (m/s)', color='#2ca02c')
-    ax2_wind.tick_params(axis='y', labelcolor='#2ca02c')
-    ax2_wind.set_ylim(0, 20)
-    ax2_wind.grid(False)
-
-    # 風向矢印の描画 (quiver)
-    # 風向は「吹いてくる方向」なのでベクトルを反転させる
-
-    u = [-np.sin(d * (np.pi / 8))  for d in wind_dirs]
-    v = [-np.cos(d * (np.pi / 8)) for d in wind_dirs]
- 
-    # ax3風向を並べる
-    ax3.quiver(past_times, [0.5]*len(past_times), u, v, 
-               color='#2ca02c', angles='uv', scale=45, width=0.015,
-               headwidth=2, headlength=2.5, headaxislength=2, 
-               pivot='middle', alpha=0.7)
-    
-    ax3.set_yticks([]) # Y軸の目盛りを消す
-    ax3.set_ylabel('風向', color='#2ca02c', rotation=0, labelpad=20, va='center')
-    ax3.patch.set_facecolor('#222222') # 背景を少し暗くして「帯」を表現
-    ax3.patch.set_alpha(0.5)
-
-    # --- 4. 共通設定と時間軸の修正 ---
-    for ax in [ax1, ax2]:
-        ax.set_xlim(start_time, end_time) # ここで表示範囲を固定
-        ax.axvline(now, color='white', linestyle='-', linewidth=1.5, alpha=0.8) # 現在線
-        ax.grid(True, alpha=0.5, linestyle='--')
-
-    # X軸の目盛り設定
-    # HourLocator(byhour=[0, 3, 6, 9, 12, 15, 18, 21]) などで正時に固定
-    formatter = mdates.DateFormatter('%H:%M', tz=tz)
-    ax2.xaxis.set_major_formatter(formatter)
-    ax2.xaxis.set_major_locator(mdates.HourLocator(byhour=[0, 3, 6, 9, 12, 15, 18, 21], tz=tz))
 
+class DashboardRenderer:
     """
-    # --- 5. 傘判定・天気情報の表示 ---
-    emoji = wt.get_weather_emoji(forecast_info.weather_codes[0])
-    status_map = {0: "傘不要", 1: "折り畳み推奨", 2: "必須"}
-    info_text = (
-        f"現在の天気:{emoji} {forecast_info.weather[0]}\n"
-        f"傘(6h): {status_map[umbrella.level_6h]} (最高降水確率{int(umbrella.max_pop_6h)}%)\n"
-        f"傘(12h): {status_map[umbrella.level_12h]} (最高降水確率{int(umbrella.max_pop_12h)}%)"
-    )
-    fig.text(0.76, 0.86, info_text, fontsize=11, color='white',
-             bbox=dict(facecolor='#333333', alpha=0.8, edgecolor='none', boxstyle='round,pad=0.5'))
+    ダッシュボードの図を作り置きして使い回す描画クラス
+    軸・ラベル・目盛りなどの背景は表示範囲が変わったときだけ描き、
+    データ(線・棒・矢印・文字)は毎回背景の上に重ねて描く(ブリッティング)
     """
 
-    plt.savefig('img/weather_report.png', bbox_inches='tight', dpi=150)
-    plt.close(fig)
+    def __init__(self, figsize=(11, 9), dpi=150, png_compress_level=1):
+        self.dpi = dpi
+        #PNGの圧縮レベル(0-9)。描画後の処理時間の大半は圧縮なので低めにしておく
+        self.png_compress_level = png_compress_level
+        self._window = None
+        self._background = None
+        self._crop = None
+        self._dynamic = []
+
+        self.gfx = gfx = graphics()
+        # --- 1. スタイルの設定 (ダークモード) ---
+        with gfx.plt.style.context('dark_background'):
+            self.fig = gfx.Figure(figsize=figsize, dpi=dpi)
+            self.canvas = gfx.FigureCanvasAgg(self.fig)
+            self._build()
+
+    def _build(self):
+        fig = self.fig
+        ax1, ax2, ax3 = fig.subplots(3, 1, sharex=True, gridspec_kw={'height_ratios': [3, 1.5, 0.3]})
+        fig.subplots_adjust(top=0.82, hspace=0.15) #上下の間隔をつめて一体感を出す
+        self.ax1, self.ax2, self.ax3 = ax1, ax2, ax3
+
+        # --- 1段目: 日付・時刻・天気アイコン ---
+        # テキスト配置 (座標は 0.0〜1.0 の相対位置)
+        self.date_text = fig.text(0.21, 0.87, "", fontsize=24, color='white', fontweight='bold', animated=True)
+        self.weather_icon = self._icon_slot(xy=(0.39, 0.81), zoom=0.25) # 天気アイコン
+
+        # --- 2段目: 各種数値・傘アイコン ---
+        self.metrics_text = fig.text(0.12, 0.84, "", fontsize=14, color='#cccccc', animated=True)
+
+        # 傘情報とアイコン
+        fig.text(0.69, 0.85, "傘判定:", fontsize=12, color='#cccccc')
+        self.umb6_icon = self._icon_slot(xy=(0.69, 0.78), zoom=0.25)
+        fig.text(0.75, 0.89, "6時間", fontsize=12, color='#cccccc')
+        self.umb12_icon = self._icon_slot(xy=(0.75, 0.78), zoom=0.25)
+        fig.text(0.81, 0.89, "12時間", fontsize=12, color='#cccccc')
+
+        # --- 2. 上段：気温グラフ (ax1) ---
+        self.past_temp_line, = ax1.plot([], [], color='#ff7f0e', linewidth=3, label='観測気温', animated=True)
+        self.future_temp_line, = ax1.plot([], [], color='#ff7f0e', linestyle='--', linewidth=3, label='予報気温', animated=True)
+        self.at_line, = ax1.plot([], [], color='#ffbb78', linewidth=2, alpha=0.7, label='体感温度', animated=True)
+
+        ax1.set_ylabel('気温 (℃)', color='#ff7f0e', fontsize=12)
+        ax1.tick_params(axis='y', labelcolor='#ff7f0e')
+        ax1.set_ylim(-5, 35)
+        ax1.set_ylabel('気温 (℃)')
+        ax1.grid(True, alpha=0.5)
+        ax1.legend(loc='upper left', frameon=False)
+
+        #降水確率　二軸グラフ
+        self.ax1_prec = ax1.twinx()
+        self.ax1_prec.set_ylim(0,100) # 降水量(100mm/h)と降水確率(100%)がこの軸の最大
+        self.ax1_prec.set_ylabel('降水量(mm/h) / 確率(%)', color='#1f77b4', fontsize=12)
+        self.ax1_prec.tick_params(axis='y', labelcolor='#1f77b4')
+        self.ax1_prec.grid(False) # 右軸のグリッドは非表示
+
+        # --- 3. サブグラフ (ax2)：湿度 ＆ 風速 ---
+        self.hum_line, = ax2.plot([], [], color='#5bc0de', linewidth=2, label='湿度', animated=True)
+        ax2.set_ylabel('湿度 (%)', color='#5bc0de', fontsize=12)
+        ax2.tick_params(axis='y', labelcolor='#5bc0de')
+        ax2.set_ylim(0, 100)
+
+        # 風速 (右軸)
+        self.ax2_wind = ax2.twinx()
+        self.wind_line, = self.ax2_wind.plot([], [], color='#2ca02c', linewidth=2, label='風速', animated=True)
+        self.ax2_wind.set_ylabel('風速 [絶対値] (m/s)', color='#2ca02c')
+        self.ax2_wind.tick_params(axis='y', labelcolor='#2ca02c')
+        self.ax2_wind.set_ylim(0, 20)
+        self.ax2_wind.grid(False)
+
+        ax3.set_ylim(0, 1)
+        ax3.set_yticks([]) # Y軸の目盛りを消す
+        ax3.set_ylabel('風向', color='#2ca02c', rotation=0, labelpad=20, va='center')
+        ax3.patch.set_facecolor('#222222') # 背景を少し暗くして「帯」を表現
+        ax3.patch.set_alpha(0.5)
+
+        # --- 4. 共通設定 ---
+        # 現在時刻に垂直線を引く
+        self.now_lines = [
+            ax1.axvline(0, color='white', linestyle=':', alpha=0.5, animated=True)
+        ]
+        for ax in [ax1, ax2]:
+            self.now_lines.append(ax.axvline(0, color='white', linestyle='-', linewidth=1.5, alpha=0.8, animated=True)) # 現在線
+            ax.grid(True, alpha=0.5, linestyle='--')
+
+        #データを足しても表示範囲が変わらないように自動調整を止める
+        for ax in [ax1, self.ax1_prec, ax2, self.ax2_wind, ax3]:
+            ax.set_autoscale_on(False)
+
+    #アイコンを差し替えて使う配置枠
+    def _icon_slot(self, xy, zoom):
+        imagebox = self.gfx.OffsetImage(np.zeros((1, 1, 4)), zoom=zoom)
+        ab = self.gfx.AnnotationBbox(imagebox, xy, xycoords='figure fraction',
+                                     frameon=False, box_alignment=(0, 0.5), animated=True)
+        self.fig.add_artist(ab)
+        return ab
+
+    def _set_icon(self, slot, image_path, colorize_white=True):
+        try:
+            img = get_icon(image_path, colorize_white)
+            if img is None:
+                slot.set_visible(False)
+                return
+            slot.offsetbox.set_data(img)
+            slot.set_visible(True)
+        except Exception as e:
+            print(f"Error loading icon {image_path}: {e}")
+            slot.set_visible(False)
+
+    #表示範囲が変わったときだけX軸を設定し直し、背景を描き直す
+    def _set_window(self, now, tz):
+        ts = now.timestamp()
+        anchor = datetime.fromtimestamp(ts - ts % WINDOW_STEP.total_seconds(), tz=tz)
+        window = (anchor - timedelta(hours=WINDOW_HOURS), anchor + timedelta(hours=WINDOW_HOURS), tz)
+        if window == self._window:
+            return
+        self._window = window
+        self._background = None
+
+        start_time, end_time, _ = window
+        for ax in [self.ax1, self.ax2]:
+            ax.set_xlim(start_time, end_time) # ここで表示範囲を固定
+
+        # X軸の目盛り設定
+        # HourLocator(byhour=[0, 3, 6, 9, 12, 15, 18, 21]) などで正時に固定
+        formatter = self.gfx.mdates.DateFormatter('%H:%M', tz=tz)
+        self.ax2.xaxis.set_major_formatter(formatter)
+        self.ax2.xaxis.set_major_locator(self.gfx.mdates.HourLocator(byhour=[0, 3, 6, 9, 12, 15, 18, 21], tz=tz))
+
+    #前回のデータ用に作った棒・文字・矢印を取り除く
+    def _clear_dynamic(self):
+        for artist in self._dynamic:
+            artist.remove()
+        self._dynamic = []
+
+    def _add_dynamic(self, artists):
+        for artist in artists:
+            artist.set_animated(True)
+            self._dynamic.append(artist)
+
+    def _update(self, past_data, intr_temps, intr_pops, forecast_info, umbrella, now):
+        # アメダスのデータを古いデータを先頭にした列データにする
+        # 体感温度・風向ベクトルはここで1回だけ計算して各グラフで使い回す
+        series = build_observation_series(past_data[1:])
+
+        latest = max(past_data[1:], key=lambda x: x.time)
+        at_latest = series.apparent_temp[-1]
+
+        # --- 1段目: 日付・時刻・天気アイコン ---
+        date_str = now.strftime('%m/%d')
+        time_str = now.strftime('%H:%M')
+        self.date_text.set_text(f"{date_str}  {time_str}")
+
+        # 天気アイコン ( weather_codes[0] からファイル名を判定 )
+        weather_icon_path = f"icons/weather/weather_code/{forecast_info.weather_codes[0]}.png"
+        self._set_icon(self.weather_icon, weather_icon_path, colorize_white=True)
+
+        # --- 2段目: 各種数値・傘アイコン ---
+        # 数値テキスト
+        metrics_text = (
+            f"気温: {latest.temp:.1f}℃   体感: {at_latest:.1f}℃   "
+            f"湿度: {latest.humidity}%   降水: {latest.precipitation1h}mm"
+        )
+        self.metrics_text.set_text(metrics_text)
+
+        # 6h傘アイコン ( umbrella.level_6h からファイル名判定 )
+        self._set_icon(self.umb6_icon, f"icons/weather/umb_func/{umbrella.level_6h}.png", colorize_white=True)
+        # 12h傘アイコン
+        self._set_icon(self.umb12_icon, f"icons/weather/umb_func/{umbrella.level_12h}.png", colorize_white=True)
+
+        # --- 2. 上段：気温グラフ (ax1) ---
+        # 実績データ (history[1:])
+        past_times = self.gfx.mdates.date2num(series.datetimes)
+        # 補間予報データ (fine_temps)
+        future_times = self.gfx.mdates.date2num([f.time for f in intr_temps])
+        future_temps = [f.value for f in intr_temps]
+
+        self.past_temp_line.set_data(past_times, series.temp)
+        self.future_temp_line.set_data(future_times, future_temps)
+        self.at_line.set_data(past_times, series.apparent_temp)
+
+        now_num = self.gfx.mdates.date2num(now)
+        for line in self.now_lines:
+            line.set_xdata([now_num, now_num])
+
+        self._clear_dynamic()
+
+        # 過去：アメダス降水量 (mm)
+        past_prec = series.precipitation1h # 降水量
+        bars_p = self.ax1_prec.bar(past_times, past_prec, color='#00ffff', alpha=0.5, width=0.03, label='降水量(mm/h)')
+        self._add_dynamic(bars_p)
+        # 降水量の数値を棒の上に表示（0mmより大きい時のみ）
+        for bar in bars_p:
+            height = bar.get_height()
+            if height > 0:
+                self._add_dynamic([self.ax1_prec.text(bar.get_x() + bar.get_width()/2., height + 1,
+                              f'{height}mm', ha='center', va='bottom', color='#00ffff', fontsize=8, fontweight='bold')])
+
+        #降水確率
+        valid_pops = [p for p in intr_pops if p.time >= now]
+        pop_times = [p.time for p in valid_pops]
+        pop_vals = [p.value for p in valid_pops]
+        if pop_times:
+            # facecolor='none' で中身を空に、edgecolor で枠線を描画
+            self._add_dynamic(self.ax1_prec.bar(self.gfx.mdates.date2num(pop_times), pop_vals, facecolor='none', edgecolor='#1f77b4',
+                         linewidth=1.5, width=0.03, label='降水確率(%)', alpha=0.8))
+
+        # --- 3. サブグラフ (ax2)：湿度 ＆ 風速 ---
+        # 実績データのみ（右半分は空く）
+        self.hum_line.set_data(past_times, series.humidity)
+        self.wind_line.set_data(past_times, series.wind)
+
+        # 風向矢印の描画 (quiver)
+        # 風向は「吹いてくる方向」なのでベクトルを反転させる
+        # ax3風向を並べる
+        self._add_dynamic([self.ax3.quiver(past_times, np.full(len(series), 0.5), series.wind_u, series.wind_v,
+                   color='#2ca02c', angles='uv', scale=45, width=0.015,
+                   headwidth=2, headlength=2.5, headaxislength=2,
+                   pivot='middle', alpha=0.7)])
+
+        """
+        # --- 5. 傘判定・天気情報の表示 ---
+        emoji = wt.get_weather_emoji(forecast_info.weather_codes[0])
+        status_map = {0: "傘不要", 1: "折り畳み推奨", 2: "必須"}
+        info_text = (
+            f"現在の天気:{emoji} {forecast_info.weather[0]}\n"
+            f"傘(6h): {status_map[umbrella.level_6h]} (最高降水確率{int(umbrella.max_pop_6h)}%)\n"
+            f"傘(12h): {status_map[umbrella.level_12h]} (最高降水確率{int(umbrella.max_pop_12h)}%)"
+        )
+        fig.text(0.76, 0.86, info_text, fontsize=11, color='white',
+                 bbox=dict(facecolor='#333333', alpha=0.8, edgecolor='none', boxstyle='round,pad=0.5'))
+        """
+
+    #毎回描き直すアーティスト(データと時刻に依存するもの)
+    def _animated_artists(self):
+        return [
+            self.date_text, self.metrics_text,
+            self.weather_icon, self.umb6_icon, self.umb12_icon,
+            self.past_temp_line, self.future_temp_line, self.at_line,
+            self.hum_line, self.wind_line,
+            *self.now_lines, *self._dynamic
+        ]
+
+    #背景を描いて保存し、bbox_inches='tight'相当の切り抜き範囲を求める
+    def _draw_background(self):
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+        renderer = self.canvas.get_renderer()
+        tight = self.fig.get_tightbbox(renderer).padded(0.1) # pad_inches=0.1
+        width, height = self.canvas.get_width_height()
+        left = max(0, int(tight.x0 * self.dpi))
+        right = min(width, int(np.ceil(tight.x1 * self.dpi)))
+        upper = max(0, height - int(np.ceil(tight.y1 * self.dpi)))
+        lower = min(height, height - int(tight.y0 * self.dpi))
+        self._crop = (left, upper, right, lower)
+
+    def render(self, past_data, intr_temps, intr_pops, forecast_info, umbrella, now=None):
+        """データを更新して描画し、PNGのバイト列を返す"""
+        with metrics.stage("render_png"):
+            png = self._render(past_data, intr_temps, intr_pops, forecast_info, umbrella, now)
+        metrics.add_bytes("render_png", len(png))
+        return png
+
+    def _render(self, past_data, intr_temps, intr_pops, forecast_info, umbrella, now):
+        # データのタイムゾーンを取得と時間の設定
+        tz = past_data[0].time.tzinfo
+        if now is None:
+            now = datetime.now(tz=tz)
+
+        with self.gfx.plt.style.context('dark_background'):
+            self._set_window(now, tz)
+            self._update(past_data, intr_temps, intr_pops, forecast_info, umbrella, now)
+
+            if self._background is None:
+                self._draw_background()
+            else:
+                self.canvas.restore_region(self._background)
+            for artist in self._animated_artists():
+                self.fig.draw_artist(artist)
+
+        width, height = self.canvas.get_width_height()
+        image = self.gfx.Image.frombuffer('RGBA', (width, height), self.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        buf = io.BytesIO()
+        image.crop(self._crop).save(buf, format='png', dpi=(self.dpi, self.dpi),
+                                    compress_level=self.png_compress_level)
+        return buf.getvalue()
+
+
+_renderer = None
+
+#プロセス内で使い回すダッシュボード描画クラス
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = DashboardRenderer()
+    return _renderer
+
+def draw_weather_dashboard(past_data, intr_temps, intr_pops, forecast_info, umbrella):
+    png = get_renderer().render(past_data, intr_temps, intr_pops, forecast_info, umbrella)
+    with open(OUTPUT_PATH, 'wb') as f:
+        f.write(png)
 
 
 
@@ -219,14 +438,13 @@ def draw_weather_dashboard(past_data, intr_temps, intr_pops, forecast_info, umbr
 if __name__ == "__main__":
     past_data = wt.collect_12th_amedas00()
 
-    forecast_temps = wt.get_weather_forcast().temps
-    intr_temps = wt.interpolate_forecast(forecast_temps, "temps")
-
-    forecast_pops = wt.get_weather_forcast().pops
-    intr_pops = wt.interpolate_forecast(forecast_pops, "pops")
-    
+    #予報は1回だけ取得して気温・降水確率・天気コードで使い回す
     forecast_info = wt.get_weather_forcast()
-    
+
+    #気温の補間は取得済みのアメダスデータを使い、履歴を取り直さない
+    intr_temps = wt.interpolate_forecast(forecast_info.temps, "temps", past_data)
+    intr_pops = wt.interpolate_forecast(forecast_info.pops, "pops")
+
     umbrella = wt.judge_umbrella_necessity(intr_pops)
 
     draw_weather_dashboard(past_data, intr_temps, intr_pops, forecast_info, umbrella)
@@ -0,0 +1,392 @@
+import hashlib
+import json
+import math
+import os
+import queue
+import threading
+from datetime import date, datetime, timedelta
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+
+import metrics
+import train
+import weather as wt
+import chart_data
+from amedas_archive import get_archive
+
+#既定の待ち受けアドレス(.envのWEB_HOST, WEB_PORTで上書き可能)
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templates", "index.html")
+
+#ブラウザには毎回ETagで確認させる(変わっていなければ304で本文を送らない)
+CACHE_CONTROL = "no-cache"
+
+#プッシュ配信(Server-Sent Events)の設定
+#途中のプロキシに切られないように、何も無くてもこの間隔でコメント行を送る
+KEEPALIVE_SEC = 25
+#送り切れずに溜まったらその画面の接続を切る(再接続すると最新の状態から受け直す)
+CLIENT_QUEUE_SIZE = 32
+#ブラウザが再接続するまでの待ち時間(ミリ秒)
+RETRY_MS = 3000
+
+#アーカイブした観測を返す期間(時間)の既定値と上限
+DEFAULT_HISTORY_HOURS = 24
+HISTORY_MAX_HOURS = 24 * 31
+
+
+#datetimeなどをJSONに変換する
+def _json_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"JSONに変換できません: {type(obj)}")
+
+
+def to_json(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+
+
+#状態の変化を接続中の画面に配信する
+#話題(trains, amedas, umbrella, dashboard)ごとに最後に送った内容を覚えておき、
+#内容が変わったときだけ全ての接続に1回ずつ送る。画面の数や更新間隔によらず仕事量は変化の回数で決まる
+class EventHub:
+    def __init__(self):
+        self._latest = {}
+        self._clients = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    #内容が前回と同じなら何もせずFalseを返す
+    def publish(self, topic: str, obj) -> bool:
+        data = to_json(obj)
+        with self._lock:
+            if self._latest.get(topic, (None, None))[1] == data:
+                return False
+            self._counter += 1
+            message = self._message(self._counter, topic, data)
+            self._latest[topic] = (message, data)
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(message)
+                except queue.Full:
+                    #受け取りが追いつかない画面は切断する
+                    self._clients.discard(client)
+                    self._disconnect(client)
+        return True
+
+    #終了の合図(None)を入れる。キューが一杯なら古いメッセージを1つ捨てる
+    @staticmethod
+    def _disconnect(client):
+        try:
+            client.put_nowait(None)
+        except queue.Full:
+            try:
+                client.get_nowait()
+            except queue.Empty:
+                pass
+            client.put_nowait(None)
+
+    @staticmethod
+    def _message(event_id: int, topic: str, data: bytes) -> bytes:
+        return f"id: {event_id}\nevent: {topic}\ndata: ".encode("utf-8") + data + b"\n\n"
+
+    #新しい接続を登録し、(受信キュー, 現在の状態をまとめたメッセージ)を返す
+    def subscribe(self):
+        client = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._clients.add(client)
+            snapshot = b"".join(message for message, _ in self._latest.values())
+        return client, f"retry: {RETRY_MS}\n\n".encode("utf-8") + snapshot
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    #全ての接続を終わらせる
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, set()
+        for client in clients:
+            self._disconnect(client)
+
+
+#列車の配信内容
+#残り時間や徒歩・ダッシュの判定は画面側で毎秒計算するので、発車時刻(エポックミリ秒)と所要時間だけを送る
+#(判定が切り替わるたびに送り直さなくてよい)
+def train_payload(trains, settings) -> dict:
+    return {
+        "walk_min": settings.WALK_TIME_MIN,
+        "dash_min": settings.DASH_TIME_MIN,
+        "trains": [
+            {
+                "train_time": t.train_time,
+                "train_type": t.train_type,
+                "train_destination": t.train_destination,
+                "train_color": t.train_color,
+                "departure": int(t.departure.timestamp() * 1000),
+            }
+            for t in trains
+        ],
+    }
+
+
+#templates/index.html を読み込んで$変数を埋める(ファイルが更新されたら読み直す)
+class PageTemplate:
+    def __init__(self, path: str = TEMPLATE_PATH):
+        self.path = path
+        self._mtime = None
+        self._template = None
+        self._lock = threading.Lock()
+
+    def render(self, **values) -> bytes:
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._mtime:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._template = Template(f.read())
+                self._mtime = mtime
+            template = self._template
+        return template.safe_substitute(values).encode("utf-8")
+
+
+#常駐プロセス(DashboardDaemon)がメモリに持っている最新の状態をHTTPで配信する
+#  /                : templates/index.html
+#  /dashboard.png   : 最新のダッシュボード画像
+#  /api/trains      : 次に乗れる電車(upcoming_train)
+#  /api/amedas      : 最新のアメダス観測
+#  /api/umbrella    : 傘の判定(UmbrellaResult)
+#  /api/chart       : ブラウザで描くためのグラフデータ(chart_data)
+#  /api/history     : アーカイブした観測(?hours=24、AMEDAS_ARCHIVE=1のときだけ)
+#  /events          : 上記の変化のプッシュ配信(Server-Sent Events)
+#  /metrics         : 処理段階ごとの計測(Prometheusのテキスト形式、METRICS_ENABLED=1のときだけ)
+#  /metrics.json    : 同じ内容のJSON
+class DashboardServer:
+    def __init__(self, daemon, host: str = None, port: int = None, template: PageTemplate = None):
+        load_dotenv()
+        self.daemon = daemon
+        self.host = host or os.getenv("WEB_HOST") or DEFAULT_HOST
+        self.port = int(port if port is not None else (os.getenv("WEB_PORT") or DEFAULT_PORT))
+        self.template = template or PageTemplate()
+        self.routes = {
+            "/": self.index,
+            "/index.html": self.index,
+            "/dashboard.png": self.dashboard_png,
+            "/api/trains": self.trains,
+            "/api/amedas": self.amedas,
+            "/api/umbrella": self.umbrella,
+            "/api/chart": self.chart,
+        }
+        if metrics.get_metrics() is not None:
+            self.routes["/metrics"] = self.metrics_text
+            self.routes["/metrics.json"] = self.metrics_json
+        #クエリ文字列を受け取るハンドラ
+        self.query_routes = {}
+        if get_archive() is not None:
+            self.query_routes["/api/history"] = self.history
+        self._httpd = None
+        self._thread = None
+
+        self.hub = EventHub()
+        with daemon.lock:
+            current = [("trains", daemon.trains), ("umbrella", daemon.umbrella),
+                       ("amedas", daemon.past_data[0] if daemon.past_data else None),
+                       ("dashboard", daemon.dashboard_etag), ("chart", daemon.chart_etag)]
+        for topic, value in current:
+            if value is not None:
+                self.on_change(topic, value)
+        daemon.add_listener(self.on_change)
+
+    #常駐プロセスから状態の変化を受け取り、配信する形にして送る
+    def on_change(self, topic, value):
+        if topic == "trains":
+            self.hub.publish(topic, train_payload(value, train.load_settings()))
+        elif topic in ("amedas", "umbrella"):
+            self.hub.publish(topic, value._asdict())
+        elif topic in ("dashboard", "chart"):
+            self.hub.publish(topic, {"etag": value})
+
+    #各ハンドラは(Content-Type, 本文, ETag)を返す。まだデータが無ければNone
+    def index(self):
+        settings = wt.load_forecast_settings()
+        body = self.template.render(location_name=settings.location_name or "")
+        return "text/html; charset=utf-8", body, make_etag(body)
+
+    def dashboard_png(self):
+        with self.daemon.lock:
+            png, etag = self.daemon.dashboard_png, self.daemon.dashboard_etag
+        if png is None:
+            return None
+        return "image/png", png, etag
+
+    def trains(self):
+        with self.daemon.lock:
+            trains = self.daemon.trains
+        if trains is None:
+            return None
+        return self._json([t._asdict() for t in trains])
+
+    def amedas(self):
+        with self.daemon.lock:
+            past_data = self.daemon.past_data
+        if not past_data:
+            return None
+        #先頭が最新の観測(以降は正時の観測を新しい順)
+        return self._json(past_data[0]._asdict())
+
+    def umbrella(self):
+        with self.daemon.lock:
+            umbrella = self.daemon.umbrella
+        if umbrella is None:
+            return None
+        return self._json(umbrella._asdict())
+
+    def chart(self):
+        with self.daemon.lock:
+            body, etag = self.daemon.chart_json, self.daemon.chart_etag
+        if body is None:
+            return None
+        return "application/json; charset=utf-8", body, etag
+
+    #最後の観測からさかのぼってhours時間分の観測(グラフデータのobservedと同じ形)
+    def history(self, query):
+        try:
+            hours = float(query.get("hours", [DEFAULT_HISTORY_HOURS])[0])
+        except ValueError:
+            hours = DEFAULT_HISTORY_HOURS
+        if not math.isfinite(hours):
+            hours = DEFAULT_HISTORY_HOURS
+        hours = float(min(max(hours, 1), HISTORY_MAX_HOURS))
+        station = get_archive().station(wt.default_amedas_number())
+        #まだ記録が無ければobservedの各列は空になる
+        series = station.recent(timedelta(hours=hours))
+        return self._json({
+            "v": chart_data.CHART_VERSION,
+            "station": station.station,
+            "hours": hours,
+            "observed": chart_data.observed_columns(series),
+        })
+
+    def metrics_text(self):
+        body = metrics.get_metrics().prometheus_text().encode("utf-8")
+        return "text/plain; version=0.0.4; charset=utf-8", body, make_etag(body)
+
+    def metrics_json(self):
+        return self._json(metrics.get_metrics().snapshot())
+
+    def _json(self, obj):
+        body = to_json(obj)
+        return "application/json; charset=utf-8", body, make_etag(body)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def _respond(self, send_body):
+                path, _, query = self.path.partition("?")
+                if path == "/events":
+                    if send_body:
+                        self._stream()
+                    else:
+                        #HEADはヘッダだけ返し、配信の接続は作らない
+                        self._stream_headers()
+                    return
+                if path in server.query_routes:
+                    route = partial(server.query_routes[path], parse_qs(query))
+                else:
+                    route = server.routes.get(path)
+                if route is None:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+                try:
+                    result = route()
+                except Exception as e:
+                    print(f"{self.path}の応答でエラーが発生しました: {e}")
+                    self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+                    return
+                if result is None:
+                    #起動直後でまだデータを取得していない
+                    self.send_response(HTTPStatus.SERVICE_UNAVAILABLE)
+                    self.send_header("Retry-After", "5")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                content_type, body, etag = result
+                if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+                    self.send_response(HTTPStatus.NOT_MODIFIED)
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", CACHE_CONTROL)
+                    self.end_headers()
+                    return
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", CACHE_CONTROL)
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def _stream_headers(self):
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Cache-Control", "no-store")
+                self.send_header("X-Accel-Buffering", "no")
+                self.end_headers()
+
+            #接続が切れるまで変化を送り続ける(1接続につき1スレッド)
+            def _stream(self):
+                client, snapshot = server.hub.subscribe()
+                try:
+                    self._stream_headers()
+                    self.wfile.write(snapshot)
+                    self.wfile.flush()
+                    while True:
+                        try:
+                            message = client.get(timeout=KEEPALIVE_SEC)
+                        except queue.Empty:
+                            message = b": keepalive\n\n"
+                        if message is None:
+                            break
+                        self.wfile.write(message)
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server.hub.unsubscribe(client)
+                    self.close_connection = True
+
+            #アクセスごとのログは出さない
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    #別スレッドで待ち受けを始める
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="web", daemon=True)
+        self._thread.start()
+        print(f"http://{self.host}:{self.port}/ で待ち受けています")
+
+    def stop(self):
+        self.hub.close()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
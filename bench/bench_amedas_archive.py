@@ -0,0 +1,128 @@
+"""アメダスのアーカイブ(amedas_archive)のベンチマーク
+
+1地点の10分ごとの観測を合成してアーカイブに書き込み、ファイルの大きさと、
+最近の12時間・24時間・7日・30日を切り出して列データにする時間を計測する。
+比較として、同じ期間を全国スナップショットから作り直す場合
+(10分ごとの全国JSONを1件ずつ解析する)の時間を、1件の解析時間から見積もる。
+書き込んだ観測は読み出して元の値と一致するか(0と欠測を含めて)確かめる。
+
+使い方:
+    python bench/bench_amedas_archive.py
+    python bench/bench_amedas_archive.py --days 365 --repeat 50
+"""
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+
+import weather as wt
+from amedas_archive import COLUMNS, JST, AmedasArchive
+
+WINDOWS = [("12h", timedelta(hours=12)), ("24h", timedelta(hours=24)),
+           ("7d", timedelta(days=7)), ("30d", timedelta(days=30))]
+
+
+#days日分の10分ごとの観測を合成する(一部は欠測)
+def synthetic_observations(days, seed=0):
+    rng = random.Random(seed)
+    end = datetime(2026, 10, 18, 12, 0, tzinfo=JST)
+    count = days * 24 * 6
+    rows = []
+    for i in range(count, 0, -1):
+        t = end - timedelta(minutes=10 * (i - 1))
+        hour = t.hour + t.minute / 60
+        rows.append(wt.Amedas_data(
+            time=t,
+            temp=round(15 + 6 * math.sin((hour - 9) / 24 * 2 * math.pi) + rng.uniform(-0.5, 0.5), 1),
+            humidity=rng.randint(30, 100),
+            precipitation1h=rng.choice([0.0] * 8 + [0.5, 2.0]),
+            wind_direction=rng.randint(0, 16),
+            wind=None if rng.random() < 0.01 else round(rng.uniform(0, 10), 1)
+        ))
+    return rows
+
+
+#0と欠測(None)だけの観測(無風・降水なし・北の風と、全項目の欠測)
+def edge_observations():
+    end = datetime(2026, 10, 18, 12, 0, tzinfo=JST)
+    zero = wt.Amedas_data(time=end - timedelta(minutes=10), temp=0.0, humidity=0,
+                          precipitation1h=0.0, wind_direction=0, wind=0.0)
+    missing = wt.Amedas_data(time=end, temp=None, humidity=None,
+                             precipitation1h=None, wind_direction=None, wind=None)
+    return [zero, missing]
+
+
+#アーカイブから読み出した値が書き込んだ観測と一致するか確かめる(欠測はNaN)
+def check_round_trip(station, rows):
+    series = station.between(rows[0].time, rows[-1].time + timedelta(seconds=1))
+    assert len(series) == len(rows), f"件数が違います: {len(series)} != {len(rows)}"
+    assert np.array_equal(series.time, [r.time.timestamp() for r in rows]), "時刻が違います"
+    for name in COLUMNS:
+        expected = np.array([np.nan if getattr(r, name) is None else getattr(r, name) for r in rows], dtype=np.float64)
+        actual = getattr(series, name)
+        assert np.allclose(actual, expected, atol=1e-9, equal_nan=True), \
+            f"{name}が元の値と違います: {actual[:5]} != {expected[:5]}"
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = synthetic_observations(args.days)
+    workdir = tempfile.mkdtemp(prefix="amedas-archive-")
+    try:
+        station = AmedasArchive(workdir).station("44132")
+
+        #最後の1日分を除いてまとめて書き込み、残りは毎回の更新と同じく1件ずつ追記する
+        split = len(rows) - 144
+        bulk_ms, _ = timed(lambda: station.append(rows[:split]), 1)
+        start = time.perf_counter()
+        for row in rows[split:]:
+            station.append([row])
+        append_ms = (time.perf_counter() - start) / 144 * 1000
+        size = os.path.getsize(station.path)
+        print(f"{len(station)}件 ({args.days}日) {size} bytes, 1年あたり {size / args.days * 365 / 1024:.0f} KB")
+        print(f"まとめて書き込み {bulk_ms:.1f} ms, 1件ずつの追記 {append_ms:.3f} ms/件")
+
+        check_round_trip(station, rows)
+        edge = AmedasArchive(workdir).station("00000")
+        edge.append(edge_observations())
+        check_round_trip(edge, edge_observations())
+        print("読み出した値は書き込んだ観測と一致しました(0と欠測を含む)")
+
+        #比較: 全国スナップショット1件の解析時間
+        import bench_amedas_parse
+        raw = bench_amedas_parse.synthetic_map()
+        parse_ms, _ = timed(lambda: wt.parse_amedas_map(raw, [bench_amedas_parse.STATION]), 5)
+
+        print(f"\n{'window':<8}{'records':>9}{'archive(ms)':>13}{'snapshots(ms,見積)':>20}")
+        for label, duration in WINDOWS:
+            archive_ms, series = timed(lambda: station.recent(duration), args.repeat)
+            estimate = parse_ms * len(series)
+            print(f"{label:<8}{len(series):>9}{archive_ms:>13.3f}{estimate:>20.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
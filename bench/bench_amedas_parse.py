@@ -0,0 +1,116 @@
+"""アメダス全国スナップショットの解析ベンチマーク
+
+全体をjson.loadsする方法(full)と、指定地点だけを取り出す方法(filtered)の
+処理時間とピークメモリ(tracemalloc / プロセスの最大RSS)を比較する。
+
+使い方:
+    python bench/bench_amedas_parse.py                 # 合成した約1300地点のデータで計測
+    python bench/bench_amedas_parse.py --file map.json # 実際のmap/{時刻}.jsonで計測
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import weather as wt
+
+STATION = "44132"
+
+
+#気象庁のmap/{時刻}.jsonと同じ形の合成データを作る
+def synthetic_map(stations: int = 1300, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    numbers = [f"{11001 + i * 67}" for i in range(stations - 1)] + [STATION]
+    data = {}
+    for number in sorted(numbers):
+        data[number] = {
+            "pressure": [round(rng.uniform(990, 1030), 1), 0],
+            "normalPressure": [round(rng.uniform(990, 1030), 1), 0],
+            "temp": [round(rng.uniform(-10, 35), 1), 0],
+            "humidity": [rng.randint(10, 100), 0],
+            "snow": [None, 5],
+            "sun10m": [rng.randint(0, 10), 0],
+            "sun1h": [round(rng.random(), 1), 0],
+            "precipitation10m": [0.0, 0],
+            "precipitation1h": [round(rng.choice([0.0, 0.0, 0.5, 2.0]), 1), 0],
+            "precipitation3h": [0.0, 0],
+            "precipitation24h": [0.0, 0],
+            "windDirection": [rng.randint(0, 16), 0],
+            "wind": [round(rng.uniform(0, 15), 1), 0],
+        }
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def parse(raw: bytes, mode: str):
+    return wt.parse_amedas_map(raw, [STATION], mode=mode)
+
+
+#1回あたりの平均処理時間(ms)とtracemallocのピーク(KB)
+def measure(raw: bytes, mode: str, repeat: int):
+    parse(raw, mode)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(raw, mode)
+    elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    parse(raw, mode)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024
+
+
+#別プロセスで1回だけ解析し、プロセスの最大RSS(KB)を返す
+#mode="none"は解析せずに読み込みまでの基準値を測る
+def measure_rss(path: str, mode: str) -> int:
+    code = (
+        "import resource, sys;"
+        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r});"
+        "import bench_amedas_parse as b;"
+        f"raw = open({path!r}, 'rb').read();"
+        f"{mode!r} != 'none' and b.parse(raw, {mode!r});"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return int(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="計測に使うmap/{時刻}.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.file:
+        path = args.file
+        with open(path, "rb") as f:
+            raw = f.read()
+    else:
+        raw = synthetic_map()
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".synthetic_map.json")
+        with open(path, "wb") as f:
+            f.write(raw)
+
+    #両方の方法で同じ結果になることを確認してから計測する
+    assert parse(raw, "full") == parse(raw, "filtered")
+
+    print(f"payload: {len(raw) / 1024:.1f} KB")
+    print(f"{'mode':<10}{'time/parse(ms)':>16}{'traced peak(KB)':>18}{'peak RSS(KB)':>16}")
+    print(f"{'none':<10}{'-':>16}{'-':>18}{measure_rss(path, 'none'):>16}")
+    for mode in ["full", "filtered"]:
+        elapsed_ms, peak_kb = measure(raw, mode, args.repeat)
+        rss_kb = measure_rss(path, mode)
+        print(f"{mode:<10}{elapsed_ms:>16.3f}{peak_kb:>18.1f}{rss_kb:>16}")
+
+    if not args.file:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""グラフ出力のベンチマーク
+
+同じ観測・予報データから、サーバーでmatplotlibを使って描くPNG(weather_graph)と、
+ブラウザで描くためのグラフデータ(chart_data)を作り、生成時間とサイズを比較する。
+通信は行わず、合成した24時間分のアメダス観測と予報を使う。
+
+使い方:
+    python bench/bench_chart_payload.py
+    python bench/bench_chart_payload.py --repeat 20
+"""
+import argparse
+import gzip
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import weather as wt
+import chart_data
+
+JST = timezone(timedelta(hours=9))
+
+
+#10分ごとの観測(12時間分+1件)と、6時間ごとの降水確率・気温の予報を合成する
+def synthetic_inputs(now, seed=0):
+    rng = random.Random(seed)
+    latest = now.replace(minute=now.minute // 10 * 10, second=0, microsecond=0)
+    past_data = []
+    for i in range(72, -1, -1):
+        t = latest - timedelta(minutes=10 * i)
+        hour = t.hour + t.minute / 60
+        past_data.append(wt.Amedas_data(
+            time=t,
+            temp=round(15 + 6 * math.sin((hour - 9) / 24 * 2 * math.pi) + rng.uniform(-0.3, 0.3), 1),
+            humidity=rng.randint(40, 90),
+            precipitation1h=rng.choice([0.0] * 8 + [0.5, 2.0]),
+            wind_direction=rng.randint(1, 16),
+            wind=round(rng.uniform(0, 8), 1)
+        ))
+
+    base = latest.replace(hour=latest.hour // 6 * 6, minute=0)
+    pops = [wt.WeatherPoint(base + timedelta(hours=6 * i), float(v))
+            for i, v in enumerate([10, 30, 60, 20, 0, 10])]
+    temps = [wt.WeatherPoint(base + timedelta(hours=h), float(v))
+             for h, v in [(3, 19), (9, 12), (27, 20), (33, 11)]]
+    forecast_info = wt.WeatherForecast(
+        location_name="東京", weather=["晴れ", "くもり", "雨"], weather_codes=["100", "200", "300"],
+        pops=pops, temps=temps
+    )
+    intr_temps = wt.interpolate_forecast(forecast_info.temps, "temps", past_data)
+    intr_pops = wt.interpolate_forecast(forecast_info.pops, "pops")
+    umbrella = wt.judge_umbrella_necessity(intr_pops)
+    return past_data, intr_temps, intr_pops, forecast_info, umbrella
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    now = datetime.now(JST)
+    inputs = synthetic_inputs(now)
+    rows = []
+
+    #グラフデータ: 初回(import済み)と2回目以降
+    first_ms, body = timed(lambda: chart_data.chart_json(*inputs, now=now), 1)
+    warm_ms, body = timed(lambda: chart_data.chart_json(*inputs, now=now), args.repeat)
+    rows.append(("chart json", first_ms, warm_ms, len(body), len(gzip.compress(body))))
+
+    #PNG: 初回はmatplotlibの読み込みと図の組み立てを含む。2回目以降は毎分の描き直し
+    start = time.perf_counter()
+    import weather_graph as wg
+    renderer = wg.DashboardRenderer()
+    png = renderer.render(*inputs, now=now)
+    first_ms = (time.perf_counter() - start) * 1000
+    minutes = iter(range(1, args.repeat + 1))
+    warm_ms, png = timed(lambda: renderer.render(*inputs, now=now + timedelta(minutes=next(minutes))), args.repeat)
+    rows.append(("png", first_ms, warm_ms, len(png), len(gzip.compress(png))))
+
+    print(f"{'output':<12}{'first(ms)':>12}{'warm(ms)':>12}{'bytes':>10}{'gzip':>10}")
+    for label, first_ms, warm_ms, size, gz in rows:
+        print(f"{label:<12}{first_ms:>12.1f}{warm_ms:>12.2f}{size:>10}{gz:>10}")
+
+
+if __name__ == "__main__":
+    main()
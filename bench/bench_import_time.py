@@ -0,0 +1,91 @@
+"""import時間のベンチマーク
+
+各エントリーポイントのモジュールを新しいプロセスで `python -X importtime` を付けて
+importし、合計時間と重いimportの上位を表示する。
+--check を付けると bench/import_budget.json の上限時間と
+「読み込んではいけないモジュール」(scipy, matplotlibなど)を確認し、違反があれば終了コード1を返す。
+
+使い方:
+    python bench/bench_import_time.py                  # 計測結果を表示
+    python bench/bench_import_time.py --check          # 予算と照合する
+    python bench/bench_import_time.py --json out.json  # 結果をJSONで保存する
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+BUDGET_PATH = os.path.join(BENCH_DIR, "import_budget.json")
+
+
+#新しいプロセスでmoduleをimportし、(合計ms, 重いimport上位, 読み込まれたモジュール)を返す
+def measure(module: str, repeat: int, top: int = 5):
+    code = f"import {module}, sys, json; print(json.dumps(sorted(sys.modules)))"
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=APP_DIR, capture_output=True, text=True, check=True
+        )
+        rows = []
+        for line in out.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            #名前の字下げは読み込みの入れ子の深さを表すので残す
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            if self_us.strip().isdigit():
+                rows.append((int(cumulative_us), name[1:].rstrip()))
+        #対象モジュールの行は、そこから読み込まれたモジュールの行の後に字下げ無しで出力される
+        end = max(i for i, (_, name) in enumerate(rows) if name == module)
+        start = end
+        while start > 0 and rows[start - 1][1].startswith(" "):
+            start -= 1
+        total_us = rows[end][0]
+        #複数回のうち最も速い回を採用してばらつきを抑える
+        if best is None or total_us < best[0]:
+            heavy = sorted(((us, name.strip()) for us, name in rows[start:end]), reverse=True)[:top]
+            best = (total_us, heavy, json.loads(out.stdout.strip().splitlines()[-1]))
+    total_us, heavy, modules = best
+    return total_us / 1000, [(name, us / 1000) for us, name in heavy], modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="import_budget.jsonと照合する")
+    parser.add_argument("--json", help="結果を保存するJSONファイル")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(BUDGET_PATH, encoding="utf-8") as f:
+        budget = json.load(f)
+
+    results = {}
+    violations = []
+    for module, rule in budget.items():
+        total_ms, heavy, modules = measure(module, args.repeat)
+        loaded = [name for name in rule.get("forbid", []) if name in modules]
+        results[module] = {"total_ms": round(total_ms, 1), "heaviest": heavy, "forbidden_loaded": loaded}
+
+        print(f"{module:<16}{total_ms:>9.1f} ms  (上限 {rule.get('max_ms', '-')} ms)")
+        for name, ms in heavy:
+            print(f"    {name:<40}{ms:>9.1f} ms")
+        if loaded:
+            violations.append(f"{module}: 読み込んではいけないモジュールを読み込んでいます {loaded}")
+        if "max_ms" in rule and total_ms > rule["max_ms"]:
+            violations.append(f"{module}: {total_ms:.1f} ms > 上限 {rule['max_ms']} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    for violation in violations:
+        print(violation)
+    if args.check and violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""複数画面の描画(render_farm)のベンチマーク
+
+代役サーバー(jma_standin.py)から記録データを配信し、N画面分のダッシュボードを
+1プロセスで順に描く場合と、プロセスプールで並列に描く場合を比較する。
+画面はアメダス地点と大きさ・解像度を変えて作る(予報はfixtures/area.jsonの地点)。
+データの取得は1回の描画につき1回だけ行われ、その時間も含めて計測する。
+1回目はプロセスの起動とmatplotlibの読み込みを含むので、2回目以降と分けて表示する。
+
+使い方:
+    python bench/bench_render_farm.py
+    python bench/bench_render_farm.py --screens 8 --workers 1,2,4 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from jma_standin import FIXTURES_DIR, start_standin
+from bench_suite import prepare_workdir
+
+#画面の大きさ(インチ)と解像度
+SCREEN_SIZES = [((11, 9), 150), ((8, 6), 100), ((16, 9), 120)]
+
+
+def make_profiles(count, area):
+    from render_farm import ScreenProfile
+    profiles = []
+    for i in range(count):
+        figsize, dpi = SCREEN_SIZES[i % len(SCREEN_SIZES)]
+        #合成データの地点番号(bench_amedas_parse.synthetic_map)と記録した地点
+        number = area["AMEDAS_NUMBER"] if i == 0 else f"{11001 + i * 67}"
+        profiles.append(ScreenProfile(
+            name=f"screen{i}", location_name=area["LOCATION_NAME"], meso_area_code=area["MESO_AREA_CODE"],
+            local_area_code=area["LOCAL_AREA_CODE"], city_code=area["CITY_CODE"], amedas_number=number,
+            figsize=figsize, dpi=dpi, output=f"img/screen{i}.png"
+        ))
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--screens", type=int, default=6)
+    parser.add_argument("--workers", default="1,2,4", help="比較するプロセス数(カンマ区切り)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    standin = start_standin(fixtures_dir=args.fixtures)
+    workdir, area = prepare_workdir(os.path.abspath(args.fixtures), standin.base_url, 0)
+    rows = []
+    try:
+        from render_farm import RenderFarm
+        profiles = make_profiles(args.screens, area)
+        for workers in [int(w) for w in args.workers.split(",")]:
+            farm = RenderFarm(profiles, max_workers=workers)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    count = len(farm.render_all())
+                    first_ms = (time.perf_counter() - start) * 1000
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        farm.render_all()
+                    warm_ms = (time.perf_counter() - start) / args.repeat * 1000
+            finally:
+                farm.close()
+            rows.append((farm.max_workers, count, first_ms, warm_ms))
+    finally:
+        standin.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    serial_ms = rows[0][3]
+    print(f"{args.screens}画面 (CPU {os.cpu_count()})")
+    print(f"{'workers':>8}{'screens':>9}{'first(ms)':>12}{'warm(ms)':>12}{'speedup':>9}")
+    for workers, count, first_ms, warm_ms in rows:
+        print(f"{workers:>8}{count:>9}{first_ms:>12.1f}{warm_ms:>12.1f}{serial_ms / warm_ms:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
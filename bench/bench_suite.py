@@ -0,0 +1,283 @@
+"""オフラインのベンチマーク一式
+
+記録したデータ(fixtures/)を代役サーバー(jma_standin.py)から配信し、気象庁に通信せずに
+更新処理全体と主な関数を計測する。結果はJSONで保存し、前回の結果と比較できる。
+
+    refresh_cold   キャッシュ(スナップショット・予報・曲線)を消してからの更新1回
+                   (最新時刻→アメダス13件→予報→補間→傘判定→画像→列車)
+    refresh_warm   キャッシュがある状態での更新1回(毎分の更新と同じ)
+    その他         get_amedas_data, interpolate_forecast(曲線あり/なし), list_apparent_temp,
+                   upcoming_train, render_png(毎分の描き直し), chart_json
+
+各項目の中央値・平均・p95・最小(ミリ秒)と、更新1回のメモリ使用量(tracemallocのピーク)、
+プロセスの最大常駐メモリ(ru_maxrss)を記録する。
+地域の設定は.envではなく fixtures/area.json を使う。
+
+使い方:
+    python bench/bench_suite.py
+    python bench/bench_suite.py --repeat 20 --latency-ms 30 --jitter-ms 10
+    python bench/bench_suite.py --output before.json
+    python bench/bench_suite.py --compare before.json      # 中央値が10%以上遅くなった項目に印を付ける
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from jma_standin import FIXTURES_DIR, start_standin
+
+SCHEMA_VERSION = 1
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+REGRESSION_RATIO = 1.10
+
+
+def _ms_stats(samples) -> dict:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "median": round(statistics.median(ordered), 3),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p95": round(p95, 3),
+        "min": round(ordered[0], 3),
+        "n": len(ordered),
+    }
+
+
+#setupは計測に含めない
+def measure(func, repeat, setup=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return _ms_stats(samples)
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #macOSはバイト、Linuxはキロバイト
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+#作業ディレクトリ(時刻表・画像・キャッシュ)を用意し、アプリの設定を環境変数で与える
+def prepare_workdir(fixtures_dir, base_url, rate):
+    workdir = tempfile.mkdtemp(prefix="dashboard-bench-")
+    shutil.copytree(os.path.join(fixtures_dir, "train_data"), os.path.join(workdir, "data", "train_data"))
+    os.makedirs(os.path.join(workdir, "img"))
+    with open(os.path.join(fixtures_dir, "area.json"), encoding="utf-8") as f:
+        area = json.load(f)
+    os.environ.update(area)
+    os.environ.update({
+        "JMA_BASE_URL": base_url,
+        "JMA_REQUESTS_PER_SEC": str(rate),
+        "AMEDAS_CACHE_DIR": os.path.join(workdir, "cache"),
+        "WALK_TIME_MIN": "8",
+        "DASH_TIME_MIN": "5",
+        "METRICS_ENABLED": "0",
+    })
+    os.chdir(workdir)
+    return workdir, area
+
+
+class Pipeline:
+    def __init__(self):
+        #環境変数を設定してから読み込む
+        import weather as wt
+        import forecast_curve
+        import train
+        import chart_data
+        from amedas_store import get_snapshot_store
+        from forecast_client import get_forecast_client
+        from weather_graph import DashboardRenderer
+        self.wt = wt
+        self.forecast_curve = forecast_curve
+        self.train = train
+        self.chart_data = chart_data
+        self.store = get_snapshot_store()
+        self.forecast_client = get_forecast_client()
+        self.renderer = DashboardRenderer()
+        self.minute = 0
+        self.inputs = None
+
+    #通信・曲線のキャッシュを消す(レンダラーと時刻表の索引は起動時に一度作るものなので残す)
+    def reset_caches(self):
+        shutil.rmtree(self.store.root, ignore_errors=True)
+        os.makedirs(self.store.root, exist_ok=True)
+        self.forecast_client.clear()
+        with self.forecast_curve._curves_lock:
+            self.forecast_curve._curves.clear()
+
+    #毎分の更新1回分(画像の時刻は1分ずつ進める)
+    def refresh(self):
+        wt = self.wt
+        base_time = wt.amedas_now_time()
+        past_data = wt.collect_12th_amedas00(base_time=base_time)
+        forecast_info = wt.get_weather_forcast()
+        intr_temps = wt.interpolate_forecast(forecast_info.temps, "temps", past_data)
+        intr_pops = wt.interpolate_forecast(forecast_info.pops, "pops")
+        umbrella = wt.judge_umbrella_necessity(intr_pops)
+        self.minute += 1
+        now = base_time + timedelta(minutes=self.minute % 60)
+        self.renderer.render(past_data, intr_temps, intr_pops, forecast_info, umbrella, now=now)
+        self.train.upcoming_train(self.train.train_context(now.replace(tzinfo=None)))
+        self.inputs = (past_data, intr_temps, intr_pops, forecast_info, umbrella)
+        return base_time
+
+
+def run_suite(pipeline, repeat) -> dict:
+    wt = pipeline.wt
+    results = {}
+
+    #初回(描画の準備・時刻表の読み込みを含む)は別に1回だけ計測する
+    pipeline.reset_caches()
+    results["refresh_first"] = measure(pipeline.refresh, 1)
+    results["refresh_cold"] = measure(pipeline.refresh, repeat, setup=pipeline.reset_caches)
+    results["refresh_warm"] = measure(pipeline.refresh, repeat)
+
+    base_time = pipeline.refresh()
+    past_data, intr_temps, intr_pops, forecast_info, umbrella = pipeline.inputs
+    results["get_amedas_data"] = measure(lambda: wt.get_amedas_data(base_time), repeat)
+    results["interpolate_forecast"] = measure(
+        lambda: wt.interpolate_forecast(forecast_info.temps, "temps", past_data), repeat)
+    results["interpolate_forecast_fit"] = measure(
+        lambda: wt.interpolate_forecast(forecast_info.temps, "temps", past_data), repeat,
+        setup=pipeline.forecast_curve._curves.clear)
+    results["list_apparent_temp"] = measure(lambda: wt.list_apparent_temp(past_data), repeat)
+    context = pipeline.train.train_context(base_time.replace(tzinfo=None))
+    results["upcoming_train"] = measure(lambda: pipeline.train.upcoming_train(context), repeat)
+
+    minutes = iter(range(1, repeat + 1))
+    results["render_png"] = measure(
+        lambda: pipeline.renderer.render(*pipeline.inputs, now=base_time + timedelta(minutes=next(minutes))), repeat)
+    results["chart_json"] = measure(lambda: pipeline.chart_data.chart_json(*pipeline.inputs, now=base_time), repeat)
+    return results
+
+
+#キャッシュを消した更新1回のメモリのピーク(KB)
+def measure_memory(pipeline) -> int:
+    pipeline.reset_caches()
+    tracemalloc.start()
+    try:
+        pipeline.refresh()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def compare(results, baseline) -> list:
+    rows = []
+    for name, stats in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        ratio = stats["median"] / before["median"] if before["median"] else float("inf")
+        rows.append((name, before["median"], stats["median"], ratio, ratio >= REGRESSION_RATIO))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="代役サーバーの応答遅延")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="代役サーバーがエラーを返す割合(0〜1)")
+    parser.add_argument("--rate", type=float, default=0, help="1秒あたりの最大リクエスト数(0で制限なし)")
+    parser.add_argument("--output", help="結果のJSON(既定: bench/results/日時.json)")
+    parser.add_argument("--compare", help="比較する以前の結果のJSON")
+    parser.add_argument("--verbose", action="store_true", help="アプリの出力を表示する")
+    args = parser.parse_args()
+
+    config = {
+        "repeat": args.repeat, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+        "error_rate": args.error_rate, "rate": args.rate,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    output = os.path.abspath(output)
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    cwd = os.getcwd()
+
+    standin = start_standin(fixtures_dir=args.fixtures, latency_ms=args.latency_ms,
+                            jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    workdir, area = prepare_workdir(os.path.abspath(args.fixtures), standin.base_url, args.rate)
+    app_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with app_output:
+            pipeline = Pipeline()
+            results = run_suite(pipeline, args.repeat)
+            memory = {"refresh_peak_kb": measure_memory(pipeline), "max_rss_kb": _max_rss_kb()}
+    finally:
+        standin.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "area": area,
+        "config": config,
+        "results": results,
+        "memory": memory,
+        "standin": dict(standin.stats),
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'name':<26}{'median':>10}{'mean':>10}{'p95':>10}{'min':>10}")
+    for name, stats in results.items():
+        print(f"{name:<26}{stats['median']:>10.2f}{stats['mean']:>10.2f}{stats['p95']:>10.2f}{stats['min']:>10.2f}")
+    print(f"メモリ: 更新1回のピーク {memory['refresh_peak_kb']} KB, 最大常駐 {memory['max_rss_kb']} KB")
+    print(f"代役サーバー: {report['standin']}")
+    print(f"保存しました: {output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n比較({baseline.get('commit')} -> {report['commit']}、中央値ms)")
+        regressed = False
+        for name, before, after, ratio, slower in compare(results, baseline):
+            regressed |= slower
+            print(f"{name:<26}{before:>10.2f}{after:>10.2f}{ratio:>8.2f}x{'  遅くなった' if slower else ''}")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""時刻表の読み込みベンチマーク
+
+CSV(train_master.csv + schedule_*.csv)を読む従来の方法と、
+バイナリ時刻表(timetable.bin)をメモリマップで読む方法の
+読み込み時間・メモリ使用量(tracemalloc)・ファイルサイズを比較する。
+
+使い方:
+    python bench/bench_timetable_load.py                      # 合成した時刻表で計測
+    python bench/bench_timetable_load.py --data data/train_data  # 実際の時刻表で計測
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import train
+import timetable_bin
+
+
+#合成した時刻表(平日・土曜・休日)をdata_dirに書き出す
+def write_synthetic(data_dir, seed=0):
+    rng = random.Random(seed)
+    masters = [(f"M{i:02d}", rng.choice(["普通", "快速", "特急"]), f"行先{i % 12}", f"#{rng.randrange(1 << 24):06x}")
+               for i in range(30)]
+    with open(os.path.join(data_dir, "train_master.csv"), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "type", "dest", "color"])
+        writer.writerows(masters)
+    for name, count in [("weekday", 260), ("saturday", 210), ("weekend", 190)]:
+        minutes = sorted(rng.sample(range(5 * 60, 25 * 60), count))
+        with open(os.path.join(data_dir, f"schedule_{name}.csv"), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["hour", "min", "master_id"])
+            for m in minutes:
+                writer.writerow([m // 60, m % 60, rng.choice(masters)[0]])
+
+
+#全ての時刻表を新しい索引で読み込む
+def load_all(data_dir, compiled_path):
+    index = train.TimetableIndex(
+        master_path=os.path.join(data_dir, "train_master.csv"),
+        compiled_path=compiled_path
+    )
+    for name in timetable_bin.schedule_files(data_dir):
+        index.schedule(os.path.join(data_dir, name))
+    return index
+
+
+def measure(data_dir, compiled_path, repeat):
+    load_all(data_dir, compiled_path)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        load_all(data_dir, compiled_path)
+    elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    index = load_all(data_dir, compiled_path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del index
+    return elapsed_ms, peak / 1024, retained / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="時刻表のディレクトリ(省略時は合成データ)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data
+        if data_dir is None:
+            data_dir = tmp
+            write_synthetic(data_dir)
+        compiled_path = timetable_bin.compile_timetable(data_dir, os.path.join(tmp, "timetable.bin"))
+        errors = timetable_bin.verify(data_dir, compiled_path)
+        if errors:
+            sys.exit("\n".join(errors))
+
+        csv_bytes = sum(os.path.getsize(os.path.join(data_dir, name))
+                        for name in timetable_bin.schedule_files(data_dir) + ["train_master.csv"])
+        print(f"csv: {csv_bytes / 1024:.1f} KB   bin: {os.path.getsize(compiled_path) / 1024:.1f} KB")
+        print(f"{'source':<8}{'load(ms)':>12}{'traced peak(KB)':>18}{'retained(KB)':>15}")
+        for label, path in [("csv", os.path.join(tmp, "missing.bin")), ("bin", compiled_path)]:
+            elapsed_ms, peak_kb, retained_kb = measure(data_dir, path, args.repeat)
+            print(f"{label:<8}{elapsed_ms:>12.3f}{peak_kb:>18.1f}{retained_kb:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""気象庁サーバーの代役(ベンチマーク用)
+
+record_fixtures.py で記録したデータ(fixtures/jma/)を、気象庁と同じパスで配信する。
+遅延とエラーを指定して、通信が遅い・不安定なときの動きも計測できる。
+.envのJMA_BASE_URLをこのサーバーに向けると、アプリはそのまま代役サーバーから取得する。
+
+    全国スナップショット(map/{時刻}.json)は保存されていればそれを、無ければ最新のもの(latest_time.txtの時刻)を返す
+    予報JSONにはETagを付け、If-None-Matchが一致すれば304を返す
+
+使い方:
+    python bench/jma_standin.py --port 8090 --latency-ms 80 --jitter-ms 40 --error-rate 0.05
+    JMA_BASE_URL=http://127.0.0.1:8090 python main.py
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MAP_PREFIX = "/bosai/amedas/data/map/"
+LATEST_TIME_PATH = "/bosai/amedas/data/latest_time.txt"
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures_dir=FIXTURES_DIR, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, error_status=HTTPStatus.SERVICE_UNAVAILABLE, seed=0):
+        super().__init__(address, StandinHandler)
+        self.root = os.path.join(fixtures_dir, "jma")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files = {}
+        self.stats = {"requests": 0, "errors": 0, "not_modified": 0, "bytes": 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    #(遅延秒, エラーにするか)を決める(再現できるように乱数の種を固定する)
+    def next_fault(self):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            return delay, self._rng.random() < self.error_rate
+
+    #パスに対応するファイルの内容(gzipは展開済み)をメモリに読み込んで返す
+    def load(self, path):
+        with self._lock:
+            if path in self._files:
+                return self._files[path]
+        local = os.path.join(self.root, path.lstrip("/"))
+        body = None
+        if os.path.isfile(local):
+            with open(local, "rb") as f:
+                body = f.read()
+        elif os.path.isfile(local + ".gz"):
+            with gzip.open(local + ".gz", "rb") as f:
+                body = f.read()
+        elif path.startswith(MAP_PREFIX):
+            latest = self.latest_map_path()
+            if latest is not None and latest != path:
+                body = self.load(latest)
+        with self._lock:
+            self._files[path] = body
+        return body
+
+    def latest_map_path(self):
+        latest = self.load(LATEST_TIME_PATH)
+        if latest is None:
+            return None
+        #2026-10-18T12:00:00+09:00 -> 20261018120000
+        stamp = "".join(ch for ch in latest.decode().strip()[:19] if ch.isdigit())
+        return f"{MAP_PREFIX}{stamp}.json"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server: StandinServer
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        delay, fail = server.next_fault()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            server.count("errors")
+            self.send_response(server.error_status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = self.path.split("?", 1)[0]
+        body = server.load(path) if ".." not in path else None
+        if body is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            server.count("not_modified")
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain" if path.endswith(".txt") else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+        server.count("bytes", len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+#別スレッドで代役サーバーを起動する(port=0なら空いているポートを使う)
+def start_standin(port=0, **kwargs) -> StandinServer:
+    server = StandinServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="jma-standin", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す割合(0〜1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = StandinServer(("127.0.0.1", args.port), fixtures_dir=args.fixtures, latency_ms=args.latency_ms,
+                           jitter_ms=args.jitter_ms, error_rate=args.error_rate, error_status=args.error_status)
+    print(f"{server.base_url} で待ち受けています(JMA_BASE_URL={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(server.stats)
+
+
+if __name__ == "__main__":
+    main()
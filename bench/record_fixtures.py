@@ -0,0 +1,166 @@
+"""ベンチマーク用の気象庁データの記録
+
+bench/fixtures/ に、気象庁サーバーと同じパスでデータを保存する。
+代役サーバー(jma_standin.py)はこのディレクトリをそのまま配信する。
+
+    fixtures/jma/bosai/amedas/data/latest_time.txt
+    fixtures/jma/bosai/amedas/data/map/{時刻}.json.gz   (全国スナップショット。gzipで保存)
+    fixtures/jma/bosai/forecast/data/forecast/{府県コード}.json
+    fixtures/train_data/train_master.csv, schedule_*.csv
+    fixtures/area.json   (記録した地域の設定。ベンチマークはこの値を.envの代わりに使う)
+
+使い方:
+    python bench/record_fixtures.py                  # 気象庁から最新のデータを記録する(.envの地域設定を使う)
+    python bench/record_fixtures.py --synthetic      # 通信せずに決まった内容の合成データを書き出す
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+LATEST_TIME_PATH = "bosai/amedas/data/latest_time.txt"
+MAP_DIR = "bosai/amedas/data/map"
+FORECAST_DIR = "bosai/forecast/data/forecast"
+
+#合成データの地域(福岡)と時刻
+SYNTHETIC_AREA = {
+    "LOCATION_NAME": "福岡",
+    "MESO_AREA_CODE": "400000",
+    "LOCAL_AREA_CODE": "400010",
+    "CITY_CODE": "82182",
+    "AMEDAS_NUMBER": "82182",
+}
+SYNTHETIC_LATEST_TIME = "2026-10-18T12:00:00+09:00"
+
+
+def _write(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_area(out_dir, area: dict):
+    _write(os.path.join(out_dir, "area.json"), json.dumps(area, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def _map_path(out_dir, found_time: datetime):
+    return os.path.join(out_dir, "jma", MAP_DIR, found_time.strftime("%Y%m%d%H%M00") + ".json.gz")
+
+
+#気象庁から最新のデータを記録する(地域は.envの設定)
+def record_live(out_dir):
+    import weather as wt
+    from utils import jma_url, polite_get
+
+    settings = wt.load_forecast_settings()
+    meso_area_code = settings.meso_area_code
+    _write_area(out_dir, {
+        "LOCATION_NAME": settings.location_name,
+        "MESO_AREA_CODE": meso_area_code,
+        "LOCAL_AREA_CODE": settings.local_area_code,
+        "CITY_CODE": settings.city_code,
+        "AMEDAS_NUMBER": wt.default_amedas_number(),
+    })
+
+    response = polite_get(jma_url("/" + LATEST_TIME_PATH))
+    response.raise_for_status()
+    _write(os.path.join(out_dir, "jma", LATEST_TIME_PATH), response.content)
+    base_time = datetime.strptime(response.text.strip(), '%Y-%m-%dT%H:%M:%S%z')
+
+    #collect_12th_amedas00と同じ時刻(最新+正時13件)を記録する
+    base_hour = base_time.replace(minute=0, second=0, microsecond=0)
+    times = [base_time] + [base_hour - timedelta(hours=i) for i in range(13)]
+    for found_time in dict.fromkeys(times):
+        response = polite_get(jma_url(wt.AMEDAS_MAP_PATH.format(time=found_time.strftime("%Y%m%d%H%M00"))))
+        response.raise_for_status()
+        _write(_map_path(out_dir, found_time), gzip.compress(response.content, mtime=0))
+
+    response = polite_get(jma_url(f"/{FORECAST_DIR}/{meso_area_code}.json"))
+    response.raise_for_status()
+    _write(os.path.join(out_dir, "jma", FORECAST_DIR, f"{meso_area_code}.json"), response.content)
+
+
+#府県天気予報と同じ形の合成データ
+def synthetic_forecast(latest: datetime) -> list:
+    day = latest.replace(hour=0, minute=0, second=0, microsecond=0)
+    iso = lambda t: t.isoformat()
+    area = SYNTHETIC_AREA
+    return [{
+        "publishingOffice": "福岡管区気象台",
+        "reportDatetime": iso(day.replace(hour=11)),
+        "timeSeries": [
+            {
+                "timeDefines": [iso(day + timedelta(days=d, hours=11 if d == 0 else 0)) for d in range(3)],
+                "areas": [{
+                    "area": {"name": "福岡地方", "code": area["LOCAL_AREA_CODE"]},
+                    "weatherCodes": ["201", "300", "101"],
+                    "weathers": ["くもり　時々　晴れ", "雨", "晴れ　時々　くもり"],
+                }],
+            },
+            {
+                "timeDefines": [iso(day + timedelta(hours=h)) for h in range(12, 48, 6)],
+                "areas": [{
+                    "area": {"name": "福岡地方", "code": area["LOCAL_AREA_CODE"]},
+                    "pops": ["10", "20", "60", "70", "30", "10"],
+                }],
+            },
+            {
+                "timeDefines": [iso(day + timedelta(hours=h)) for h in (9, 24, 33)],
+                "areas": [{
+                    "area": {"name": "福岡", "code": area["CITY_CODE"]},
+                    "temps": ["21", "14", "19"],
+                }],
+            },
+        ],
+    }]
+
+
+#通信せずに決まった内容の合成データを書き出す
+def record_synthetic(out_dir):
+    import bench_amedas_parse
+    import bench_timetable_load
+
+    latest = datetime.fromisoformat(SYNTHETIC_LATEST_TIME)
+    _write_area(out_dir, SYNTHETIC_AREA)
+    _write(os.path.join(out_dir, "jma", LATEST_TIME_PATH), SYNTHETIC_LATEST_TIME.encode())
+    #全国スナップショットは最新の1件だけ置く(代役サーバーは無い時刻にこれを返す)
+    bench_amedas_parse.STATION = SYNTHETIC_AREA["AMEDAS_NUMBER"]
+    raw = bench_amedas_parse.synthetic_map()
+    _write(_map_path(out_dir, latest), gzip.compress(raw, mtime=0))
+    forecast = json.dumps(synthetic_forecast(latest), ensure_ascii=False).encode("utf-8")
+    _write(os.path.join(out_dir, "jma", FORECAST_DIR, f"{SYNTHETIC_AREA['MESO_AREA_CODE']}.json"), forecast)
+
+    train_dir = os.path.join(out_dir, "train_data")
+    os.makedirs(train_dir, exist_ok=True)
+    bench_timetable_load.write_synthetic(train_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", action="store_true", help="合成データを書き出す")
+    parser.add_argument("--out", default=FIXTURES_DIR)
+    parser.add_argument("--train-data", default="data/train_data", help="記録する時刻表のディレクトリ")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        record_synthetic(args.out)
+    else:
+        record_live(args.out)
+        train_dir = os.path.join(args.out, "train_data")
+        os.makedirs(train_dir, exist_ok=True)
+        for name in os.listdir(args.train_data):
+            if name.endswith(".csv"):
+                shutil.copy(os.path.join(args.train_data, name), train_dir)
+    print(f"記録しました: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+#app/ 以下のモジュールは同じディレクトリのモジュールを直接importするのでパスに加える
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from daemon import DashboardDaemon
+from web_server import DashboardServer
+
+# エントリーポイント(常駐してダッシュボードと列車情報を更新し続ける)
+if __name__ == "__main__":
+    daemon = DashboardDaemon()
+    #ダッシュボード画像と列車・観測・傘の情報をメモリから配信する(.envでWEB_PORT=0にすると起動しない)
+    server = DashboardServer(daemon)
+    if server.port:
+        server.start()
+    daemon.run_forever()